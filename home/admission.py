@@ -0,0 +1,406 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from django.core.serializers.json import DjangoJSONEncoder
+
+DEFAULT_LIMITS = {
+    'MAX_UPLOAD_BYTES': 200 * 1024 * 1024,  # Tamanho máximo do upload
+    'MAX_COST': 2 * 10 ** 9,  # Custo máximo (sequências x comprimento do alinhamento)
+    'INLINE_COST': 5 * 10 ** 6,  # Acima deste custo o processamento vai para a fila
+    'MAX_CONCURRENT_PER_CLIENT': 2,  # Requisições simultâneas por cliente
+    'BACKGROUND_WORKERS': 2,  # Processos da fila de processamento
+    'MAX_STORED_JOBS': 1000,  # Quantidade de jobs guardados para consulta
+    'STREAM_WORKERS': 4,  # Threads que processam os fluxos de eventos
+    'STATE_DIR': None,  # Diretório dos jobs e das vagas, compartilhado pelos workers (padrão: <tmp>/pspgd-admission)
+}
+
+
+def estimate_cost(content_length: int, first_chunk: bytes) -> dict:
+    """
+    Estima o custo de processamento de um FASTA a partir do tamanho total do
+    upload e do primeiro pedaço recebido.
+
+    A quantidade de sequências é extrapolada pela quantidade de cabeçalhos no
+    pedaço e o comprimento do alinhamento é o da maior sequência vista nele (a
+    última pode estar incompleta, o que só subestima o comprimento).
+
+    Retorna:
+    - Um dicionário com as sequências e o comprimento estimados e o custo (o produto dos dois).
+    """
+    headers = 0
+    alignment_length = 0
+    length = 0
+
+    for line in first_chunk.splitlines():
+        if line.startswith(b'>'):
+            headers += 1
+            alignment_length = max(alignment_length, length)
+            length = 0
+        else:
+            length += len(line.strip())
+    alignment_length = max(alignment_length, length)
+
+    sequences = max(1, round(headers * content_length / max(1, len(first_chunk))))
+    return {
+        'sequences': sequences,
+        'alignment_length': alignment_length,
+        'cost': sequences * alignment_length,
+    }
+
+
+class AdmissionUploadHandler(FileUploadHandler):
+    """
+    Handler de upload que estima o custo do FASTA a partir do primeiro pedaço do
+    arquivo e interrompe o upload, sem ler o restante, se o custo ultrapassar o
+    limite configurado. Os pedaços seguem para os handlers padrão.
+
+    Se o arquivo termina no primeiro pedaço, as sequências são contadas
+    diretamente em file_complete(); senão, a estimativa é feita quando o segundo
+    pedaço chega, extrapolando pelo tamanho do arquivo.
+    """
+
+    def __init__(self, request, field_name: str, max_cost: int):
+        super().__init__(request)
+        self.upload_field_name = field_name
+        self.max_cost = max_cost
+        self.request_content_length = 0
+        self.boundary = b''
+        self.first_chunk = None
+        self.estimate = None
+        self.rejected = False
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.request_content_length = content_length
+        self.boundary = boundary
+
+    def multipart_overhead(self) -> int:
+        """
+        Bytes do corpo da requisição que não são do arquivo: os delimitadores e os
+        cabeçalhos da parte do arquivo e o delimitador final. Os demais campos do
+        formulário são pequenos e não entram na conta.
+        """
+        headers = (
+            f'Content-Disposition: form-data; name="{self.field_name}"; filename="{self.file_name}"\r\n'
+            f'Content-Type: {self.content_type}\r\n\r\n'
+        )
+        delimiter = len(b'\r\n--') + len(self.boundary)
+        return delimiter + len(b'\r\n') + len(headers.encode('utf-8')) + delimiter + len(b'--\r\n')
+
+    def file_length(self) -> int:
+        # new_file() guarda o tamanho do arquivo, quando o cliente o informa
+        if self.content_length:
+            return self.content_length
+        return max(0, self.request_content_length - self.multipart_overhead())
+
+    def check_cost(self, file_length: int):
+        self.estimate = estimate_cost(file_length, self.first_chunk)
+        self.rejected = self.estimate['cost'] > self.max_cost
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.field_name == self.upload_field_name and self.estimate is None:
+            if self.first_chunk is None:
+                # O arquivo pode terminar neste pedaço: espera o próximo ou file_complete()
+                self.first_chunk = raw_data
+            else:
+                self.check_cost(self.file_length())
+                if self.rejected:
+                    raise StopUpload(connection_reset=True)
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.field_name == self.upload_field_name and self.estimate is None and self.first_chunk is not None:
+            # O arquivo inteiro está no primeiro pedaço, então a contagem é exata
+            self.check_cost(file_size)
+        return None
+
+
+def write_json(path: str, data: dict):
+    """
+    Grava o JSON em um arquivo temporário e o renomeia, para que os outros
+    processos nunca leiam um arquivo pela metade.
+    """
+    descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(descriptor, 'w') as json_file:
+        json.dump(data, json_file, cls=DjangoJSONEncoder)
+    os.replace(temporary_path, path)
+
+
+def process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class ClientConcurrencyLimiter:
+    """
+    Limita a quantidade de requisições simultâneas de cada cliente. Cada vaga é um
+    arquivo criado com O_EXCL no diretório compartilhado, então o limite vale para
+    todos os workers do servidor, e não para cada um deles. O arquivo guarda o pid
+    do processo que usa a vaga: as vagas de processos que morreram são recuperadas.
+    """
+
+    def __init__(self, directory: str, max_concurrent: int):
+        self.directory = directory
+        self.max_concurrent = max_concurrent
+        os.makedirs(directory, exist_ok=True)
+
+    def slot_prefix(self, client: str) -> str:
+        return hashlib.sha1(client.encode('utf-8')).hexdigest()
+
+    def acquire(self, client: str) -> str | None:
+        """
+        Retorna:
+        - O caminho da vaga ocupada, a ser passado para release(), ou None se o
+          cliente já estiver no limite.
+        """
+        for n in range(self.max_concurrent):
+            slot = os.path.join(self.directory, f'{self.slot_prefix(client)}-{n}')
+            for _ in range(2):
+                try:
+                    descriptor = os.open(slot, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                except FileExistsError:
+                    if not self.reclaim(slot):
+                        break
+                    continue
+                with os.fdopen(descriptor, 'w') as slot_file:
+                    slot_file.write(str(os.getpid()))
+                return slot
+        return None
+
+    @staticmethod
+    def reclaim(slot: str) -> bool:
+        """
+        Apaga a vaga se o processo que a ocupava não existe mais.
+        """
+        try:
+            with open(slot) as slot_file:
+                pid = slot_file.read()
+        except FileNotFoundError:
+            return True
+        if not pid or process_alive(int(pid)):
+            return False  # Vaga em uso (ou sendo criada por outro processo)
+        ClientConcurrencyLimiter.release(slot)
+        return True
+
+    @staticmethod
+    def claim(slot: str):
+        """
+        Passa a vaga para o processo atual (o processo da fila que recebeu o job).
+        """
+        descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(slot), suffix='.tmp')
+        with os.fdopen(descriptor, 'w') as slot_file:
+            slot_file.write(str(os.getpid()))
+        os.replace(temporary_path, slot)
+
+    @staticmethod
+    def release(slot: str):
+        try:
+            os.remove(slot)
+        except FileNotFoundError:
+            pass
+
+    def count(self, client: str) -> int:
+        prefix = self.slot_prefix(client) + '-'
+        return sum(1 for name in os.listdir(self.directory) if name.startswith(prefix))
+
+
+class JobStore:
+    """
+    Estado dos jobs da fila, um arquivo JSON por job no diretório compartilhado,
+    para que qualquer worker responda a consulta de um job criado por outro.
+    """
+
+    JOB_ID = re.compile(r'^[0-9a-f]{32}$')
+
+    def __init__(self, directory: str, max_stored_jobs: int):
+        self.directory = directory
+        self.max_stored_jobs = max_stored_jobs
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f'{job_id}.json')
+
+    def create(self) -> str:
+        job_id = uuid.uuid4().hex
+        write_json(self.path(job_id), {'status': 'queued'})
+        self._discard_finished_jobs()
+        return job_id
+
+    def update(self, job_id: str, **values):
+        write_json(self.path(job_id), {**(self.get(job_id) or {}), **values})
+
+    def get(self, job_id: str) -> dict | None:
+        if not self.JOB_ID.match(job_id):
+            return None
+        try:
+            with open(self.path(job_id)) as job_file:
+                return json.load(job_file)
+        except FileNotFoundError:
+            return None
+
+    def _discard_finished_jobs(self):
+        jobs = [entry for entry in os.scandir(self.directory) if entry.name.endswith('.json')]
+        if len(jobs) <= self.max_stored_jobs:
+            return
+
+        jobs.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in jobs[:len(jobs) - self.max_stored_jobs]:
+            job = self.get(entry.name[:-len('.json')])
+            if job is not None and job['status'] in ('done', 'error'):
+                os.remove(entry.path)
+
+
+def setup_job_process():
+    # Os processos da fila são iniciados com spawn e precisam configurar o Django
+    import django
+    django.setup()
+
+
+def run_job(store: JobStore, job_id: str, slot: str | None, function, *args):
+    """
+    Executa um job no processo da fila, gravando o andamento no JobStore, e libera
+    a vaga do cliente ao terminar.
+    """
+    if slot is not None:
+        ClientConcurrencyLimiter.claim(slot)
+    store.update(job_id, status='running')
+    try:
+        store.update(job_id, status='done', result=function(*args))
+    except Exception as error:
+        store.update(job_id, status='error', error=str(error))
+    finally:
+        if slot is not None:
+            ClientConcurrencyLimiter.release(slot)
+
+
+class JobQueue:
+    """
+    Fila de processamento em segundo plano. Os jobs rodam em um conjunto de
+    processos separado (sem disputar o GIL com as requisições do worker) e o estado
+    de cada um fica no JobStore, visível para todos os workers. A função do job e
+    os seus argumentos precisam poder ser serializados com pickle.
+    """
+
+    def __init__(self, store: JobStore, workers: int):
+        self.store = store
+        self.workers = workers
+        self.executor = None  # Criado no primeiro uso, depois do fork dos workers
+        self.lock = threading.Lock()
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=setup_job_process,
+                )
+            return self.executor
+
+    def submit(self, function, *args, slot: str | None = None) -> str:
+        """
+        Enfileira function(*args); a vaga do cliente (slot) é liberada pelo job ao
+        terminar.
+        """
+        job_id = self.store.create()
+        try:
+            future = self._executor().submit(run_job, self.store, job_id, slot, function, *args)
+        except BrokenProcessPool:
+            # Um processo da fila morreu: recria o conjunto de processos
+            with self.lock:
+                self.executor = None
+            future = self._executor().submit(run_job, self.store, job_id, slot, function, *args)
+
+        def finished(future):
+            # run_job trata os erros do job; aqui só chegam falhas do próprio processo
+            if future.exception() is not None:
+                self.store.update(job_id, status='error', error=str(future.exception()))
+                if slot is not None:
+                    ClientConcurrencyLimiter.release(slot)
+
+        future.add_done_callback(finished)
+        return job_id
+
+    def get(self, job_id: str) -> dict | None:
+        return self.store.get(job_id)
+
+
+class AdmissionController:
+    """
+    Camada de admissão dos uploads: rejeita cedo as requisições acima dos limites,
+    limita a concorrência por cliente e decide se o processamento roda na própria
+    requisição ou na fila em segundo plano. Os limites vêm de PSPGD_ADMISSION; os
+    jobs e as vagas dos clientes ficam em STATE_DIR, que deve ser o mesmo para
+    todos os workers do servidor.
+    """
+
+    def __init__(self, limits: dict | None = None):
+        self.limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self.state_dir = self.limits['STATE_DIR'] or os.path.join(tempfile.gettempdir(), 'pspgd-admission')
+        self.clients = ClientConcurrencyLimiter(
+            os.path.join(self.state_dir, 'clients'), self.limits['MAX_CONCURRENT_PER_CLIENT']
+        )
+        self.jobs = JobQueue(
+            JobStore(os.path.join(self.state_dir, 'jobs'), self.limits['MAX_STORED_JOBS']),
+            self.limits['BACKGROUND_WORKERS']
+        )
+        self.uploads_dir = os.path.join(self.state_dir, 'uploads')
+        os.makedirs(self.uploads_dir, exist_ok=True)
+        self.streams = None  # Criado no primeiro uso, depois do fork dos workers
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> 'AdmissionController':
+        return cls(getattr(settings, 'PSPGD_ADMISSION', None))
+
+    @staticmethod
+    def client_key(request) -> str:
+        return request.META.get('REMOTE_ADDR', '')
+
+    def content_length(self, request) -> int:
+        try:
+            return int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return 0
+
+    def oversized(self, request) -> bool:
+        """
+        Verifica, só pelo cabeçalho Content-Length, se o upload ultrapassa o limite.
+        """
+        return self.content_length(request) > self.limits['MAX_UPLOAD_BYTES']
+
+    def install_upload_handler(self, request, field_name: str) -> AdmissionUploadHandler:
+        """
+        Coloca o handler de estimativa antes dos handlers padrão. Deve ser chamado
+        antes do primeiro acesso a request.POST ou request.FILES.
+        """
+        handler = AdmissionUploadHandler(request, field_name, self.limits['MAX_COST'])
+        request.upload_handlers.insert(0, handler)
+        return handler
+
+    def runs_inline(self, estimate: dict | None) -> bool:
+        return estimate is None or estimate['cost'] <= self.limits['INLINE_COST']
+
+    def run_stream(self, function):
+        """
+        Executa o processamento de um fluxo de eventos em um conjunto limitado de
+        threads; acima do limite, os fluxos esperam a vez.
+        """
+        with self.lock:
+            if self.streams is None:
+                self.streams = ThreadPoolExecutor(max_workers=self.limits['STREAM_WORKERS'], thread_name_prefix='pspgd-stream')
+        self.streams.submit(function)
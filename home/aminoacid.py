@@ -1,5 +1,5 @@
 from enum import Enum
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 class Classification(Enum):
     HYDROFOBIC = 'hydrofobic'
@@ -12,6 +12,7 @@ class Classification(Enum):
     GLYCINES = 'glycines'
     PROLINES = 'prolines'
     NONE = 'none'
+    UNKNOWN = 'unknown'  # Letras fora do alfabeto (ex: 'X', 'B', 'Z')
 
 
 class L1(Enum):
@@ -68,6 +69,10 @@ class L3(Enum):
 
 class Aminoacid:
     AMINOACIDS: List['Aminoacid'] = []
+    BY_L1: Dict[str, 'Aminoacid'] = {}
+    GAP: Optional['Aminoacid'] = None
+    NONE: Optional['Aminoacid'] = None
+    UNKNOWN: Dict[str, 'Aminoacid'] = {}
 
     def __init__(self, name: str, l1: L1, l3: L3, classification: Classification):
         self.name = name
@@ -75,13 +80,37 @@ class Aminoacid:
         self.l3 = l3
         self.classification = classification
 
+    @classmethod
+    def build_lookup_tables(cls) -> None:
+        """
+        Monta as tabelas imutáveis de busca por letra. Chamado uma única vez no
+        warm-up da aplicação, antes do fork dos workers.
+        """
+        cls.BY_L1 = {a.l1.value: a for a in cls.AMINOACIDS}
+        cls.GAP = cls('Gap', L1.GAP_DOT, L3.GAP_DOT, Classification.NONE)
+        cls.NONE = cls('Gap', L1.NONE, L3.NONE, Classification.NONE)
+
     @classmethod
     def get_aminoacid(cls, letter: Optional[str]) -> 'Aminoacid':
+        """
+        Busca o aminoácido pela letra, sem diferenciar maiúsculas de minúsculas.
+        Letras desconhecidas recebem um aminoácido próprio, de classificação
+        UNKNOWN, que só é equivalente à mesma letra (e não a um gap).
+        """
+        if not cls.BY_L1:
+            cls.build_lookup_tables()
+
         if letter is None:
-            return cls('Gap', L1.NONE, L3.NONE, Classification.NONE)
+            return cls.NONE
+
+        aminoacid = cls.BY_L1.get(letter) or cls.BY_L1.get(letter.upper())
+        if aminoacid is not None:
+            return aminoacid
 
-        aminoacid_found = next((a for a in cls.AMINOACIDS if a.l1 == letter), None)
-        return aminoacid_found or cls('Gap', L1.GAP_DOT, L3.GAP_DOT, Classification.NONE)
+        letter = letter.upper()
+        if letter not in cls.UNKNOWN:
+            cls.UNKNOWN[letter] = cls(f'Unknown {letter}', L1.NONE, L3.NONE, Classification.UNKNOWN)
+        return cls.UNKNOWN[letter]
 
     def equals(self, aminoacid: 'Aminoacid') -> bool:
         return (self.l1 == aminoacid.l1 and
@@ -90,6 +119,8 @@ class Aminoacid:
                 self.classification == aminoacid.classification)
 
     def equals_classification(self, aminoacid: 'Aminoacid') -> bool:
+        if Classification.UNKNOWN in (self.classification, aminoacid.classification):
+            return self is aminoacid
         return self.classification == aminoacid.classification
 
     def substitution_score(self, aminoacid: 'Aminoacid', matrix: dict) -> int:
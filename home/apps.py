@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class HomeConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'home'
+
+    def ready(self):
+        if getattr(settings, 'PSPGD_WARMUP', True):
+            from .warmup import warm_up
+            warm_up()
@@ -0,0 +1,172 @@
+import tempfile
+from array import array
+from collections import Counter
+from typing import Iterable, Iterator
+
+
+class ColumnMajorAlignment:
+    """
+    Alinhamento armazenado em disco, em arquivos temporários, para processar
+    alinhamentos maiores que a memória disponível.
+
+    As sequências são gravadas primeiro linha a linha (row-major) e depois
+    transpostas em blocos de colunas para um arquivo column-major, de forma que
+    a composição de cada coluna possa ser lida sequencialmente. Nenhuma etapa
+    mantém em memória mais do que memory_budget bytes do alinhamento.
+    """
+
+    PADDING = b'.'
+    INDEX_ITEM_SIZE = array('q').itemsize * 2  # (offset, tamanho) de cada sequência
+
+    def __init__(self, memory_budget: int, directory: str | None = None):
+        if memory_budget < 1:
+            raise ValueError('memory_budget deve ser maior que zero.')
+
+        self.memory_budget = memory_budget
+        self.directory = directory
+        self.sequence_count = 0
+        self.max_length = 0
+        self.rows = None
+        self.index = None
+        self.columns = None
+
+    def __enter__(self) -> 'ColumnMajorAlignment':
+        self.rows = tempfile.TemporaryFile(dir=self.directory)
+        self.index = tempfile.TemporaryFile(dir=self.directory)
+        self.columns = tempfile.TemporaryFile(dir=self.directory)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for spill_file in (self.rows, self.index, self.columns):
+            if spill_file is not None:
+                spill_file.close()
+        self.rows = self.index = self.columns = None
+
+    def load(self, fasta_lines: Iterable[bytes | str]):
+        """
+        Lê o FASTA linha a linha, grava as sequências no arquivo row-major e então
+        gera o arquivo column-major. Assim como parse_fasta, ignora as entradas
+        sem nome ou sem sequência.
+        """
+        index_buffer = array('q')
+        offset = 0
+        length = 0
+        inside_entry = False
+
+        for line in fasta_lines:
+            if isinstance(line, str):
+                line = line.encode('utf-8')
+
+            if line.startswith(b'>'):
+                if inside_entry and length:
+                    index_buffer.extend((offset, length))
+                    self.max_length = max(self.max_length, length)
+                    offset += length
+                inside_entry = bool(line[1:].strip())
+                length = 0
+            elif inside_entry:
+                residues = line.strip()
+                self.rows.write(residues)
+                length += len(residues)
+
+            if len(index_buffer) * index_buffer.itemsize >= self.memory_budget:
+                self.sequence_count += self._flush_index(index_buffer)
+
+        if inside_entry and length:
+            index_buffer.extend((offset, length))
+            self.max_length = max(self.max_length, length)
+        self.sequence_count += self._flush_index(index_buffer)
+
+        self._transpose()
+
+    def _flush_index(self, index_buffer: array) -> int:
+        flushed = len(index_buffer) // 2
+        self.index.write(index_buffer.tobytes())
+        del index_buffer[:]
+        return flushed
+
+    def _read_index(self, first_row: int, last_row: int) -> array:
+        self.index.seek(first_row * self.INDEX_ITEM_SIZE)
+        entries = array('q')
+        entries.frombytes(self.index.read((last_row - first_row) * self.INDEX_ITEM_SIZE))
+        return entries
+
+    def _row_chunks(self, rows_per_chunk: int) -> Iterator[tuple[int, array]]:
+        for first_row in range(0, self.sequence_count, rows_per_chunk):
+            last_row = min(first_row + rows_per_chunk, self.sequence_count)
+            yield first_row, self._read_index(first_row, last_row)
+
+    def _read_row_slice(self, offset: int, length: int, start: int, stop: int) -> bytes:
+        """
+        Lê sequence[start:stop] de uma sequência, completando com '.' até o
+        comprimento do alinhamento, como em complete_sequences_with_dash.
+        """
+        stop = min(stop, self.max_length)
+        if stop <= start:
+            return b''
+
+        available = max(0, min(stop, length) - start)
+        self.rows.seek(offset + start)
+        residues = self.rows.read(available) if available else b''
+        return residues + self.PADDING * (stop - start - available)
+
+    def _transpose(self):
+        """
+        Transpõe o arquivo row-major em blocos de block_width colunas por
+        rows_per_chunk sequências, respeitando o orçamento de memória.
+        """
+        if not self.sequence_count:
+            return
+
+        block_width = max(1, min(self.max_length, self.memory_budget // self.sequence_count))
+        # Cada linha do bloco ocupa block_width bytes de resíduos mais sua entrada do índice
+        rows_per_chunk = max(1, self.memory_budget // (block_width + self.INDEX_ITEM_SIZE))
+
+        for first_column in range(0, self.max_length, block_width):
+            last_column = min(first_column + block_width, self.max_length)
+            width = last_column - first_column
+
+            for first_row, entries in self._row_chunks(rows_per_chunk):
+                block = b''.join(
+                    self._read_row_slice(entries[i], entries[i + 1], first_column, last_column)
+                    for i in range(0, len(entries), 2)
+                )
+
+                for j in range(width):
+                    self.columns.seek((first_column + j) * self.sequence_count + first_row)
+                    self.columns.write(block[j::width])
+
+    def column_chunks(self, column: int) -> Iterator[bytes]:
+        """
+        Lê uma coluna do arquivo column-major em pedaços de até memory_budget bytes.
+        """
+        first = column * self.sequence_count
+        last = first + self.sequence_count
+
+        for position in range(first, last, self.memory_budget):
+            self.columns.seek(position)
+            yield self.columns.read(min(self.memory_budget, last - position))
+
+    def compositions(self) -> Iterator[dict[str, int]]:
+        """
+        Gera, coluna a coluna, a composição (caractere -> quantidade) do alinhamento,
+        na ordem em que cada caractere aparece pela primeira vez na coluna.
+        """
+        for column in range(self.max_length):
+            composition = Counter()
+            for chunk in self.column_chunks(column):
+                composition.update(chunk)
+            yield {chr(character): count for character, count in composition.items()}
+
+    def row_slices(self, start: int, stop: int) -> Iterator[str]:
+        """
+        Gera sequence[start:stop] de cada sequência do alinhamento completado.
+        """
+        rows_per_chunk = max(1, self.memory_budget // self.INDEX_ITEM_SIZE)
+
+        for _, entries in self._row_chunks(rows_per_chunk):
+            for i in range(0, len(entries), 2):
+                yield self._read_row_slice(entries[i], entries[i + 1], start, stop).decode('utf-8')
@@ -0,0 +1,58 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Executado em um processo novo, para medir a inicialização a frio
+STARTUP_SCRIPT = '''
+import json, os, time
+start = time.perf_counter()
+import django
+django.setup()
+setup = time.perf_counter() - start
+
+from django.test import Client
+client = Client()
+start = time.perf_counter()
+response = client.get('/', HTTP_HOST='localhost')
+first_request = time.perf_counter() - start
+print(json.dumps({'setup': setup, 'first_request': first_request, 'status': response.status_code}))
+'''
+
+
+class Command(BaseCommand):
+    help = 'Mede o tempo de importação/inicialização e a latência da primeira requisição, com e sem warm-up.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Quantidade de processos medidos em cada modo.')
+
+    def measure(self, warmup: bool) -> dict:
+        env = dict(os.environ)
+        env['DJANGO_SETTINGS_MODULE'] = settings.SETTINGS_MODULE
+        env['PSPGD_WARMUP'] = '1' if warmup else '0'
+
+        process = subprocess.run(
+            [sys.executable, '-c', STARTUP_SCRIPT],
+            cwd=settings.BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return json.loads(process.stdout.strip().splitlines()[-1])
+
+    def handle(self, *args, **options):
+        for warmup in (False, True):
+            runs = [self.measure(warmup) for _ in range(options['runs'])]
+            setup = statistics.median(run['setup'] for run in runs) * 1000
+            first_request = statistics.median(run['first_request'] for run in runs) * 1000
+
+            self.stdout.write(
+                f"warm-up {'on ' if warmup else 'off'}: "
+                f"inicialização {setup:.1f} ms | primeira requisição {first_request:.1f} ms "
+                f"(mediana de {len(runs)} execuções)"
+            )
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from home.proteome_index import ProteomeIndex
+
+
+class Command(BaseCommand):
+    help = 'Constrói o índice persistente (resíduos mapeáveis com mmap e índice de k-mers) de um proteoma em FASTA.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('fasta', help='Arquivo FASTA do proteoma.')
+        parser.add_argument('index_dir', help='Diretório onde o índice será gravado.')
+        parser.add_argument('--kmer-size', type=int, default=2, help='Tamanho dos k-mers indexados (com 2, assinaturas como W-W-x-C já usam o índice).')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        with ProteomeIndex.build(options['fasta'], options['index_dir'], options['kmer_size']) as index:
+            self.stdout.write(
+                f"{index.meta['sequences']} sequências e {index.meta['residues']} resíduos indexados "
+                f"em {time.perf_counter() - start:.1f} s ({options['index_dir']})."
+            )
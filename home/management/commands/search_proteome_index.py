@@ -0,0 +1,32 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from home.proteome_index import ProteomeIndex
+
+
+class Command(BaseCommand):
+    help = 'Procura assinaturas PROSITE (ex: "C-x(2,4)-[ST]") em um proteoma indexado com build_proteome_index.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('index_dir', help='Diretório do índice.')
+        parser.add_argument('patterns', nargs='+', help='Assinaturas PROSITE a procurar.')
+        parser.add_argument('--scan', action='store_true', help='Percorre o proteoma inteiro em vez de usar o índice.')
+
+    def handle(self, *args, **options):
+        with ProteomeIndex(options['index_dir']) as index:
+            for pattern in options['patterns']:
+                start = time.perf_counter()
+                hits = index.search(pattern, use_index=not options['scan'])
+                if not options['scan'] and index.search_report['strategy'] == 'scan':
+                    self.stderr.write(
+                        f'{pattern}: nenhum trecho fixo com {index.kmer_size} resíduos; '
+                        f'o proteoma inteiro foi percorrido.'
+                    )
+                self.stdout.write(json.dumps({
+                    'pattern': pattern,
+                    'hits': hits,
+                    **index.search_report,
+                    'seconds': round(time.perf_counter() - start, 4),
+                }))
@@ -0,0 +1,429 @@
+import itertools
+import json
+import math
+import mmap
+import os
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from typing import Iterable, Iterator
+
+ALPHABET = b'ACDEFGHIKLMNPQRSTVWY'
+SEPARATOR = b'\n'
+
+# Tabelas de tradução usadas na codificação dos k-mers: o código do resíduo (0..19,
+# 0 para os inválidos) e um marcador 1 para os caracteres fora do alfabeto
+RESIDUE_VALUES = bytes(ALPHABET.index(c) if c in ALPHABET else 0 for c in range(256))
+INVALID_FLAGS = bytes(0 if c in ALPHABET else 1 for c in range(256))
+
+# Quantidade de k-mers codificados de uma vez durante a construção do índice
+BUILD_BLOCK_SIZE = 1 << 20
+
+# Máximo de k-mers gerados pela expansão das classes ([ST]) de uma janela da âncora
+MAX_KMER_EXPANSION = 64
+
+
+class PrositePattern:
+    """
+    Padrão PROSITE, no formato gerado por format_prosite_motifs_pattern (lista de
+    tokens como 'C', 'G(3)', '[ST]', 'x(2,4)', 'x0') ou como texto no formato
+    PROSITE ('C-x(2,4)-[ST]').
+
+    Cada token é convertido em um elemento (resíduos permitidos, mínimo, máximo),
+    em que resíduos permitidos None significa qualquer resíduo. As colunas de gap
+    ('-', '.') não correspondem a resíduos e são ignoradas.
+    """
+
+    TOKEN = re.compile(r'^(x0|x|[A-Z]|\[[^\]]*\]|-|\.|0)(?:\((-?\d+)(?:,(-?\d+))?\))?$')
+    GAP_CHARACTERS = '-.'
+
+    def __init__(self, pattern: str | Iterable[str]):
+        tokens = self.split(pattern) if isinstance(pattern, str) else list(pattern)
+        self.elements = [element for token in tokens for element in self.parse_token(token)]
+        self.regex = re.compile(b''.join(self.element_regex(element) for element in self.elements))
+
+    @staticmethod
+    def split(pattern: str) -> list[str]:
+        """
+        Separa um padrão PROSITE pelos '-' que não estão dentro de colchetes.
+        """
+        tokens = []
+        token = ''
+        depth = 0
+
+        for character in pattern.strip().rstrip('.'):
+            if character == '-' and depth == 0:
+                tokens.append(token)
+                token = ''
+                continue
+            depth += character == '['
+            depth -= character == ']'
+            token += character
+
+        tokens.append(token)
+        return [token for token in tokens if token]
+
+    def parse_token(self, token: str) -> list[tuple[str | None, int, int]]:
+        match = self.TOKEN.match(token.strip())
+        if match is None:
+            raise ValueError(f'Token PROSITE inválido: {token!r}')
+
+        symbol, first, second = match.groups()
+        count = int(first) if first is not None else 1
+        minimum, maximum = (count, int(second)) if second is not None else (count, count)
+        minimum = max(0, minimum)
+
+        if symbol in ('-', '.', '0'):
+            return []
+        if symbol == 'x':
+            return [(None, minimum, maximum)]
+        if symbol == 'x0':
+            return [(None, 0, maximum)]
+
+        residues = symbol.strip('[]')
+        allowed = ''.join(sorted(set(residues) - set(self.GAP_CHARACTERS)))
+        if not allowed:
+            return []
+        if len(allowed) < len(set(residues)):
+            # A coluna também tinha gaps: o resíduo é opcional
+            minimum = 0
+        return [(allowed, minimum, maximum)]
+
+    @staticmethod
+    def element_regex(element: tuple[str | None, int, int]) -> bytes:
+        allowed, minimum, maximum = element
+        expression = b'[^\n]' if allowed is None else b'[' + allowed.encode() + b']'
+        if minimum == maximum == 1:
+            return expression
+        return expression + b'{%d,%d}' % (minimum, maximum)
+
+    def anchors(self, kmer_size: int) -> list[tuple[list[str], int, int]]:
+        """
+        Encontra os trechos de tamanho fixo do padrão (resíduos ou classes do
+        alfabeto, sem repetição variável) com pelo menos kmer_size posições. Os
+        trechos separados por x(n,m) viram âncoras distintas, cada uma com a sua
+        faixa de distâncias até o início do padrão.
+
+        Retorna:
+        - Uma lista de tuplas (resíduos permitidos em cada posição do trecho,
+          distância mínima, distância máxima) entre o início do padrão e o início
+          do trecho.
+        """
+        anchors = []
+        minimum_offset = maximum_offset = 0
+        fixed = []
+        fixed_minimum = fixed_maximum = 0
+
+        for allowed, minimum, maximum in self.elements + [(None, 0, 0)]:
+            if allowed is not None and minimum == maximum and all(residue.encode() in ALPHABET for residue in allowed):
+                if not fixed:
+                    fixed_minimum, fixed_maximum = minimum_offset, maximum_offset
+                fixed += [allowed] * minimum
+            else:
+                if len(fixed) >= kmer_size:
+                    anchors.append((fixed, fixed_minimum, fixed_maximum))
+                fixed = []
+            minimum_offset += minimum
+            maximum_offset += maximum
+
+        return anchors
+
+
+class ProteomeIndex:
+    """
+    Índice persistente de um proteoma, para validar assinaturas PROSITE sem
+    percorrer o FASTA inteiro a cada consulta.
+
+    Arquivos do diretório do índice:
+    - residues.bin: sequências concatenadas, separadas por '\\n' (mapeado com mmap);
+    - offsets.bin: posição inicial de cada sequência em residues.bin;
+    - names.txt: nome de cada sequência, um por linha;
+    - kmer_offsets.bin / kmer_positions.bin: índice invertido de k-mers no formato
+      CSR; as posições do k-mer c ficam em positions[offsets[c]:offsets[c + 1]];
+    - meta.json: parâmetros do índice.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json')) as meta_file:
+            self.meta = json.load(meta_file)
+        self.kmer_size = self.meta['kmer_size']
+
+        self.files = []
+        self.residues = self._map('residues.bin')
+        self.offsets = self._map('offsets.bin', 'q')
+        self.kmer_offsets = self._map('kmer_offsets.bin', 'Q')
+        self.kmer_positions = self._map('kmer_positions.bin', self.meta['position_typecode'])
+
+        with open(os.path.join(directory, 'names.txt'), encoding='utf-8') as names_file:
+            self.names = names_file.read().splitlines()
+
+    def __enter__(self) -> 'ProteomeIndex':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _map(self, filename: str, typecode: str | None = None):
+        path = os.path.join(self.directory, filename)
+        if os.path.getsize(path) == 0:
+            return array(typecode or 'B')
+
+        with open(path, 'rb') as index_file:
+            mapped = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.files.append(mapped)
+        return memoryview(mapped).cast(typecode) if typecode else mapped
+
+    def close(self):
+        self.residues = self.offsets = self.kmer_offsets = self.kmer_positions = None
+        for mapped in self.files:
+            mapped.close()
+        self.files = []
+
+    @staticmethod
+    def block_kmer_codes(residues, start: int, count: int, kmer_size: int, typecode: str) -> array:
+        """
+        Codifica os count k-mers que começam a partir da posição start do buffer de
+        resíduos, sem percorrer os resíduos em Python: cada deslocamento do k-mer é
+        uma fatia traduzida com bytes.translate, espalhada em faixas de inteiro
+        (uma por k-mer) e somada com o peso da sua posição.
+
+        Retorna:
+        - Um array com o código de cada k-mer; os k-mers com algum caractere fora
+          do alfabeto (incluindo o separador de sequências) recebem um código maior
+          ou igual a len(ALPHABET) ** kmer_size.
+        """
+        segment = residues[start:start + count + kmer_size - 1]
+        values = segment.translate(RESIDUE_VALUES)
+        invalid = segment.translate(INVALID_FLAGS)
+        buckets = len(ALPHABET) ** kmer_size
+        width = array(typecode).itemsize
+
+        def lanes(data: bytes) -> int:
+            spread = bytearray(width * count)
+            spread[0::width] = data
+            return int.from_bytes(spread, 'little')
+
+        total = 0
+        for shift in range(kmer_size):
+            total += lanes(values[shift:shift + count]) * len(ALPHABET) ** (kmer_size - 1 - shift)
+            total += lanes(invalid[shift:shift + count]) * buckets
+
+        codes = array(typecode)
+        codes.frombytes(total.to_bytes(width * count, 'little'))
+        return codes
+
+    @classmethod
+    def iter_kmer_blocks(cls, residues, total: int, kmer_size: int) -> Iterator[tuple[int, array]]:
+        """
+        Gera (posição inicial, códigos) em blocos de BUILD_BLOCK_SIZE k-mers.
+        """
+        buckets = len(ALPHABET) ** kmer_size
+        # Cada faixa precisa comportar o maior código inválido sem transbordar
+        typecode = 'I' if (kmer_size + 1) * buckets < 2 ** 32 else 'Q'
+        windows = max(0, total - kmer_size + 1)
+        for start in range(0, windows, BUILD_BLOCK_SIZE):
+            yield start, cls.block_kmer_codes(residues, start, min(BUILD_BLOCK_SIZE, windows - start), kmer_size, typecode)
+
+    @classmethod
+    def read_fasta(cls, fasta_lines: Iterable[bytes]) -> Iterator[tuple[str, bytes]]:
+        name = None
+        sequence = []
+
+        for line in fasta_lines:
+            line = line.strip()
+            if line.startswith(b'>'):
+                if name and sequence:
+                    yield name, b''.join(sequence)
+                name = line[1:].decode('utf-8', 'replace').strip()
+                sequence = []
+            elif name is not None:
+                sequence.append(line.upper())
+
+        if name and sequence:
+            yield name, b''.join(sequence)
+
+    @classmethod
+    def build(cls, fasta_path: str, directory: str, kmer_size: int = 2) -> 'ProteomeIndex':
+        """
+        Constrói o índice em duas passagens (ordenação por contagem): a primeira
+        conta as ocorrências de cada k-mer e a segunda grava as posições
+        diretamente no arquivo mapeado, sem manter a lista de posições em memória.
+        Os k-mers são codificados em blocos com block_kmer_codes.
+        """
+        os.makedirs(directory, exist_ok=True)
+        path = lambda filename: os.path.join(directory, filename)
+
+        offsets = array('q')
+        total = 0
+        with open(fasta_path, 'rb') as fasta_file, \
+                open(path('residues.bin'), 'wb') as residues_file, \
+                open(path('names.txt'), 'w', encoding='utf-8') as names_file:
+            for name, sequence in cls.read_fasta(fasta_file):
+                offsets.append(total)
+                residues_file.write(sequence + SEPARATOR)
+                names_file.write(name.replace('\n', ' ') + '\n')
+                total += len(sequence) + len(SEPARATOR)
+
+        with open(path('offsets.bin'), 'wb') as offsets_file:
+            offsets_file.write(offsets.tobytes())
+
+        position_typecode = 'I' if total < 2 ** 32 else 'Q'
+        buckets = len(ALPHABET) ** kmer_size
+        counts = array('Q', bytes(8 * (buckets + 1)))
+
+        with open(path('residues.bin'), 'rb') as residues_file:
+            residues = mmap.mmap(residues_file.fileno(), 0, access=mmap.ACCESS_READ) if total else b''
+
+            # Primeira passagem: contagem e soma acumulada (kmer_offsets)
+            for _, codes in cls.iter_kmer_blocks(residues, total, kmer_size):
+                for code, count in Counter(codes).items():
+                    if code < buckets:
+                        counts[code + 1] += count
+            for code in range(buckets):
+                counts[code + 1] += counts[code]
+
+            with open(path('kmer_offsets.bin'), 'wb') as kmer_offsets_file:
+                kmer_offsets_file.write(counts.tobytes())
+
+            # Segunda passagem: grava cada posição na fatia do seu k-mer
+            item_size = array(position_typecode).itemsize
+            with open(path('kmer_positions.bin'), 'wb+') as positions_file:
+                positions_file.truncate(counts[buckets] * item_size)
+                if counts[buckets]:
+                    mapped = mmap.mmap(positions_file.fileno(), 0)
+                    positions = memoryview(mapped).cast(position_typecode)
+                    cursor = array('Q', counts[:buckets])
+                    for start, codes in cls.iter_kmer_blocks(residues, total, kmer_size):
+                        for position, code in enumerate(codes, start):
+                            if code < buckets:
+                                positions[cursor[code]] = position
+                                cursor[code] += 1
+                    positions.release()
+                    mapped.close()
+
+            if total:
+                residues.close()
+
+        with open(path('meta.json'), 'w') as meta_file:
+            json.dump({
+                'kmer_size': kmer_size,
+                'position_typecode': position_typecode,
+                'sequences': len(offsets),
+                'residues': total,
+            }, meta_file)
+
+        return cls(directory)
+
+    def kmer_positions_of(self, kmer: str) -> memoryview | array:
+        code = 0
+        for residue in kmer.encode():
+            code = code * len(ALPHABET) + ALPHABET.index(residue)
+        return self.kmer_positions[self.kmer_offsets[code]:self.kmer_offsets[code + 1]]
+
+    def anchor_windows(self, pattern: PrositePattern) -> list[tuple[list, int, int]]:
+        """
+        Converte cada janela de kmer_size posições das âncoras do padrão em (listas
+        de posições dos k-mers da janela, distância mínima, distância máxima). As
+        janelas cujas classes geram mais de MAX_KMER_EXPANSION k-mers são ignoradas.
+
+        Retorna:
+        - As janelas, da com menos ocorrências para a com mais.
+        """
+        windows = []
+        for fixed, minimum_offset, maximum_offset in pattern.anchors(self.kmer_size):
+            for shift in range(len(fixed) - self.kmer_size + 1):
+                window = fixed[shift:shift + self.kmer_size]
+                if math.prod(map(len, window)) > MAX_KMER_EXPANSION:
+                    continue
+                positions = [self.kmer_positions_of(''.join(kmer)) for kmer in itertools.product(*window)]
+                windows.append((positions, minimum_offset + shift, maximum_offset + shift))
+        return sorted(windows, key=lambda window: sum(map(len, window[0])))
+
+    @staticmethod
+    def has_position_between(positions, low: int, high: int) -> bool:
+        i = bisect_left(positions, low)
+        return i < len(positions) and positions[i] <= high
+
+    @staticmethod
+    def window_starts(lists: list, minimum_offset: int, maximum_offset: int) -> set[int]:
+        return {
+            position - offset
+            for positions in lists
+            for position in positions
+            for offset in range(minimum_offset, maximum_offset + 1)
+            if position >= offset
+        }
+
+    def candidate_starts(self, pattern: PrositePattern) -> list[int] | None:
+        """
+        Lista as posições de início candidatas a partir das âncoras do padrão: a
+        janela com menos ocorrências gera os candidatos e as demais são
+        intersectadas com eles, seja pelo conjunto dos inícios que elas geram, seja
+        (quando restam poucos candidatos) por busca binária nas suas posições, que
+        estão ordenadas. Retorna None se o padrão não tiver trecho fixo com pelo
+        menos kmer_size posições.
+        """
+        windows = self.anchor_windows(pattern)
+        if not windows:
+            return None
+
+        (lists, minimum_offset, maximum_offset), *others = windows
+        starts = self.window_starts(lists, minimum_offset, maximum_offset)
+        for lists, minimum_offset, maximum_offset in others:
+            if not starts:
+                break
+            generated = sum(map(len, lists)) * (maximum_offset - minimum_offset + 1)
+            if generated < 4 * len(starts):
+                starts &= self.window_starts(lists, minimum_offset, maximum_offset)
+            else:
+                starts = {
+                    start for start in starts
+                    if any(self.has_position_between(positions, start + minimum_offset, start + maximum_offset) for positions in lists)
+                }
+        return sorted(starts)
+
+    def search(self, pattern: str | Iterable[str] | PrositePattern, use_index: bool = True) -> list[dict]:
+        """
+        Procura as ocorrências de um padrão PROSITE no proteoma. Com o índice, só as
+        posições candidatas são verificadas com a expressão regular; sem ele (ou se o
+        padrão não tiver trecho fixo suficiente), o buffer inteiro é percorrido. A
+        estratégia usada e o número de candidatos ficam em search_report.
+
+        Retorna:
+        - Uma lista de dicionários com o nome da sequência, o início e o fim (base 0)
+          e o trecho encontrado.
+        """
+        if not isinstance(pattern, PrositePattern):
+            pattern = PrositePattern(pattern)
+
+        starts = self.candidate_starts(pattern) if use_index else None
+        self.search_report = {
+            'strategy': 'scan' if starts is None else 'index',
+            'kmer_size': self.kmer_size,
+            'candidates': None if starts is None else len(starts),
+        }
+        if starts is None:
+            lookahead = re.compile(b'(?=(' + pattern.regex.pattern + b'))')
+            matches = ((match.start(), match.group(1)) for match in lookahead.finditer(self.residues))
+        else:
+            matches = (
+                (start, match.group())
+                for start in starts
+                if (match := pattern.regex.match(self.residues, start)) is not None
+            )
+
+        hits = []
+        for start, matched in matches:
+            if not matched:
+                continue
+            sequence = bisect_right(self.offsets, start) - 1
+            begin = start - self.offsets[sequence]
+            hits.append({
+                'name': self.names[sequence],
+                'start': begin,
+                'end': begin + len(matched),
+                'match': matched.decode(),
+            })
+        return hits
@@ -1,9 +1,18 @@
+import math
+import random
+import threading
+from collections import Counter, OrderedDict
+from typing import Callable, Iterable, Iterator
+
 from .aminoacid import Aminoacid, L1, L3, Classification 
+from .column_store import ColumnMajorAlignment
 
 class FastaEntry:
-    def __init__(self, name: str, sequence: str):
+    def __init__(self, name: str, sequence: str, weight: int = 1):
         self.name = name
         self.sequence = sequence
+        # Quantidade de sequências do alinhamento original representadas por esta entrada
+        self.weight = weight
 
 class FastaService:
     def complete_sequences_with_dash(self, fasta_entries: list[FastaEntry]) -> tuple[list[FastaEntry], int]:
@@ -26,12 +35,13 @@ class ListProcessingService:
     def __init__(self):
         pass
 
-    def find_most_frequent_element(self, lst):
+    def find_most_frequent_element(self, lst, weights=None):
         """
         Encontra o elemento mais frequente em uma lista.
         
         Parâmetros:
         - lst: Uma lista de elementos (pode ser de qualquer tipo).
+        - weights: Lista opcional com o peso (multiplicidade) de cada elemento.
         
         Retorna:
         - O elemento mais frequente ou None se a lista estiver vazia.
@@ -43,12 +53,15 @@ class ListProcessingService:
         most_frequent_element = lst[0]
         max_count = 0
 
-        for element in lst:
+        if weights is None:
+            weights = [1] * len(lst)
+
+        for element, weight in zip(lst, weights):
             key = str(element)  # Converte o elemento para string para usar como chave no dicionário
             if key in frequency_map:
-                frequency_map[key] += 1
+                frequency_map[key] += weight
             else:
-                frequency_map[key] = 1
+                frequency_map[key] = weight
 
             # Atualiza o elemento mais frequente se necessário
             if frequency_map[key] > max_count:
@@ -57,13 +70,225 @@ class ListProcessingService:
 
         return most_frequent_element
 
+class RedundancyFilterService:
+    GAP_CHARACTERS = ('-', '.')
+
+    def __init__(self, kmer_size: int = 3):
+        self.kmer_size = kmer_size
+
+    def collapse_exact_duplicates(self, fasta_entries: list[FastaEntry]) -> list[FastaEntry]:
+        """
+        Agrupa sequências idênticas pelo hash da sequência, mantendo a primeira
+        ocorrência como representante e somando os pesos das duplicatas.
+
+        Parâmetros:
+        - fasta_entries: Uma lista de objetos FastaEntry.
+
+        Retorna:
+        - Uma lista de representantes (FastaEntry) com o peso acumulado.
+        """
+        representatives = {}
+
+        for entry in fasta_entries:
+            representative = representatives.get(entry.sequence)
+            if representative is None:
+                representatives[entry.sequence] = FastaEntry(entry.name, entry.sequence, entry.weight)
+            else:
+                representative.weight += entry.weight
+
+        return list(representatives.values())
+
+    def kmers(self, sequence: str) -> set[str]:
+        """
+        Retorna o conjunto de k-mers da sequência sem gaps.
+        """
+        residues = ''.join(c for c in sequence if c not in self.GAP_CHARACTERS)
+        return {residues[i:i + self.kmer_size] for i in range(len(residues) - self.kmer_size + 1)}
+
+    def identity(self, a: str, b: str) -> float:
+        """
+        Calcula a identidade entre duas sequências alinhadas, considerando apenas
+        as colunas em que pelo menos uma das sequências não possui gap.
+        """
+        length = max(len(a), len(b))
+        a = a.ljust(length, '.')
+        b = b.ljust(length, '.')
+
+        aligned = 0
+        matches = 0
+        for x, y in zip(a, b):
+            if x in self.GAP_CHARACTERS and y in self.GAP_CHARACTERS:
+                continue
+            aligned += 1
+            if x == y:
+                matches += 1
+
+        return matches / aligned if aligned else 1.0
+
+    def residue_mask(self, sequence: str) -> int:
+        """
+        Retorna um inteiro com um bit ligado para cada coluna da sequência que não é gap.
+        """
+        bits = ''.join('0' if c in self.GAP_CHARACTERS else '1' for c in reversed(sequence))
+        return int(bits or '0', 2)
+
+    def max_mismatches(self, aligned: int, identity_threshold: float) -> int:
+        """
+        Retorna a maior quantidade de colunas diferentes entre duas sequências com
+        aligned colunas alinhadas que ainda atinge o limiar, com a mesma conta de identity().
+        """
+        mismatches = max(0, math.floor((1 - identity_threshold) * aligned))
+        # Corrige o arredondamento de ponto flutuante (ex: int((1 - 0.8) * 5) == 0)
+        while mismatches < aligned and (aligned - mismatches - 1) / aligned >= identity_threshold:
+            mismatches += 1
+        return mismatches
+
+    def kmer_screen(
+        self,
+        a_kmers: set[str],
+        a_mask: int,
+        b_kmers: set[str],
+        b_mask: int,
+        identity_threshold: float
+    ) -> bool:
+        """
+        Filtro rápido de k-mers compartilhados: retorna False apenas para os pares que
+        não podem atingir o limiar de identidade.
+
+        Cada coluna diferente é uma substituição ou uma inserção/remoção entre as
+        sequências sem gaps e destrói no máximo k k-mers distintos de cada uma, então
+        um par com identidade suficiente compartilha pelo menos
+        max(|k-mers de a|, |k-mers de b|) - k * colunas diferentes k-mers.
+        """
+        # Colunas em que pelo menos uma das sequências não possui gap, como em identity()
+        aligned = (a_mask | b_mask).bit_count()
+        if not aligned:
+            return True
+
+        max_mismatches = self.max_mismatches(aligned, identity_threshold)
+        required_kmers = max(len(a_kmers), len(b_kmers)) - self.kmer_size * max_mismatches
+        return len(a_kmers & b_kmers) >= required_kmers
+
+    def cluster_by_identity(self, fasta_entries: list[FastaEntry], identity_threshold: float) -> list[FastaEntry]:
+        """
+        Agrupa de forma gulosa as sequências com identidade maior ou igual ao limiar.
+        Antes da comparação coluna a coluna, um filtro rápido de k-mers compartilhados
+        descarta os pares que não podem atingir o limiar.
+
+        Parâmetros:
+        - fasta_entries: Uma lista de objetos FastaEntry.
+        - identity_threshold: Identidade mínima (entre 0 e 1) para agrupar duas sequências.
+
+        Retorna:
+        - Uma lista de representantes (FastaEntry) com o peso acumulado de cada grupo.
+        """
+        representatives = []  # Lista de tuplas (representante, k-mers, colunas sem gap)
+
+        for entry in fasta_entries:
+            entry_kmers = self.kmers(entry.sequence)
+            entry_mask = self.residue_mask(entry.sequence)
+
+            for representative, representative_kmers, representative_mask in representatives:
+                if not self.kmer_screen(entry_kmers, entry_mask, representative_kmers, representative_mask, identity_threshold):
+                    continue
+
+                if self.identity(entry.sequence, representative.sequence) >= identity_threshold:
+                    representative.weight += entry.weight
+                    break
+            else:
+                representative = FastaEntry(entry.name, entry.sequence, entry.weight)
+                representatives.append((representative, entry_kmers, entry_mask))
+
+        return [representative for representative, _, _ in representatives]
+
+    @staticmethod
+    def validate_identity_threshold(identity_threshold: float | None):
+        """
+        Rejeita, com ValueError, limiares fora de (0, 1]: um limiar negativo juntaria
+        todas as sequências e um acima de 1 desligaria o agrupamento.
+        """
+        if identity_threshold is not None and not 0 < identity_threshold <= 1:
+            raise ValueError('identity_threshold deve estar no intervalo (0, 1].')
+
+    def filter(self, fasta_entries: list[FastaEntry], identity_threshold: float | None = None) -> list[FastaEntry]:
+        """
+        Remove a redundância do alinhamento: primeiro as duplicatas exatas e, se um
+        limiar de identidade for informado, as sequências quase idênticas.
+        """
+        self.validate_identity_threshold(identity_threshold)
+        representatives = self.collapse_exact_duplicates(fasta_entries)
+        if identity_threshold is not None:
+            representatives = self.cluster_by_identity(representatives, identity_threshold)
+        return representatives
+
+class CompositionTokenCache:
+    """
+    Cache LRU dos tokens de coluna, indexado pela composição canônica da coluna
+    (caracteres ordenados com suas quantidades) e pelo modelo de conservação.
+    O token depende só da composição, então colunas repetidas, dentro de um
+    alinhamento ou entre requisições do mesmo worker, são calculadas uma vez.
+    """
+
+    def __init__(self, maxsize: int = 4096):
+        if maxsize < 1:
+            raise ValueError('maxsize deve ser maior que zero.')
+
+        self.maxsize = maxsize
+        self.tokens = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key) -> str | None:
+        with self.lock:
+            token = self.tokens.get(key)
+            if token is None:
+                self.misses += 1
+                return None
+            self.tokens.move_to_end(key)
+            self.hits += 1
+            return token
+
+    def put(self, key, token: str):
+        with self.lock:
+            self.tokens[key] = token
+            self.tokens.move_to_end(key)
+            if len(self.tokens) > self.maxsize:
+                self.tokens.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.tokens.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.tokens),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
 class PROSITEProcessingService:
-    def __init__(self, fasta_service, list_processing_service):
-       
+    def __init__(self, fasta_service, list_processing_service, redundancy_filter_service=None, token_cache=None):
+
         self.fasta_service = fasta_service
         self.list_processing_service = list_processing_service
+        self.redundancy_filter_service = redundancy_filter_service or RedundancyFilterService()
         self.fasta_entries_with_dashes = []
         self.max_length = 0
+        self.estimated_columns = set()  # Colunas 'x' da amostragem ainda não verificadas
+        self.sampling_report = None
+        self.column_store = None  # Alinhamento em disco do processamento fora da memória
+        self.column_map = None  # Colunas originais representadas por cada token do padrão reduzido
+        self.trimming_report = None
+        self.token_cache = token_cache  # CompositionTokenCache compartilhado; None desativa a memoização
 
     def x_gap_comparate(self, a: str, b: str) -> bool:
         """
@@ -99,6 +324,102 @@ class PROSITEProcessingService:
 
         return entries
     
+    @staticmethod
+    def column_weights(fasta_entries) -> list[int] | None:
+        """
+        Retorna a multiplicidade de cada entrada, ou None se todas tiverem peso 1;
+        assim as colunas sem peso são contadas direto com Counter.
+        """
+        weights = [entry.weight for entry in fasta_entries]
+        return weights if any(weight != 1 for weight in weights) else None
+
+    def column_composition(self, characters: list[str], weights=None) -> tuple[tuple[str, int], ...]:
+        """
+        Retorna a composição canônica de uma coluna: os caracteres em ordem, cada um
+        com sua quantidade (ponderada pela multiplicidade das sequências).
+        """
+        if weights is None:
+            composition = Counter(characters)
+        else:
+            composition = Counter()
+            for character, weight in zip(characters, weights):
+                composition[character] += weight
+        return tuple(sorted(composition.items()))
+
+    def conservation_token(self, characters: list[str], score_model_conservation, weights=None) -> str:
+        """
+        Calcula o token do padrão de conservação dispersa para uma coluna do alinhamento,
+        consultando antes o cache de composições, quando houver um.
+
+        Parâmetros:
+        - characters: Os caracteres de todas as sequências na coluna.
+        - score_model_conservation: O modelo de conservação a ser usado (ex: 'BLOSUM62').
+        - weights: Lista opcional com a multiplicidade de cada sequência.
+
+        Retorna:
+        - O token da coluna ('A', '[ST]', '-', 'x' ou 'x0').
+        """
+        if self.token_cache is None:
+            return self.compute_conservation_token(characters, score_model_conservation, weights)
+
+        composition = self.column_composition(characters, weights)
+        key = (score_model_conservation, composition)
+        token = self.token_cache.get(key)
+        if token is None:
+            # Calcula sobre a composição canônica para que o token dependa só da chave
+            token = self.compute_conservation_token(
+                [character for character, _ in composition],
+                score_model_conservation,
+                [count for _, count in composition],
+            )
+            self.token_cache.put(key, token)
+        return token
+
+    def compute_conservation_token(self, characters: list[str], score_model_conservation, weights=None) -> str:
+        """
+        Calcula o token do padrão de conservação dispersa para uma coluna do alinhamento.
+
+        Parâmetros:
+        - characters: Os caracteres de todas as sequências na coluna.
+        - score_model_conservation: O modelo de conservação a ser usado (ex: 'BLOSUM62').
+        - weights: Lista opcional com a multiplicidade de cada sequência.
+
+        Retorna:
+        - O token da coluna ('A', '[ST]', '-', 'x' ou 'x0').
+        """
+        # Encontra o caractere mais frequente na posição atual, ponderado pela multiplicidade de cada sequência
+        currently_char = self.list_processing_service.find_most_frequent_element(characters, weights)
+
+        # Verifica se todos os caracteres na posição são iguais (conservação completa)
+        full_conservation = all(aminoacid == characters[0] for aminoacid in characters)
+
+        # Verifica a conservação com base no modelo de pontuação fornecido
+        if score_model_conservation == 'BLOSUM62':
+            conservation = all(
+                Aminoacid.get_aminoacid(amino).equals_substitution_matrix_blossum62_1(
+                    Aminoacid.get_aminoacid(currently_char)
+                ) for amino in characters
+            )
+        else:
+            conservation = all(
+                Aminoacid.get_aminoacid(amino).equals_classification(
+                    Aminoacid.get_aminoacid(currently_char)
+                ) for amino in characters
+            )
+
+        if full_conservation:
+            if currently_char in ['-', '.']:
+                return '-'
+            return currently_char or '0'
+
+        if conservation:
+            unique_characters = ''.join(set(characters))
+            return f'[{unique_characters}]'
+
+        if '-' in characters:
+            return 'x0'
+        return 'x'
+
     def scattered_conservation_pattern(self, fasta_entries, score_model_conservation):
         """
         Gera um padrão de conservação dispersa a partir de uma lista de entradas FASTA.
@@ -110,51 +431,238 @@ class PROSITEProcessingService:
         Retorna:
         - Uma lista de strings representando o padrão de conservação dispersa.
         """
-        scattered_conservation_pattern = []
+        return list(self.iter_scattered_conservation_pattern(fasta_entries, score_model_conservation))
+
+    def iter_scattered_conservation_pattern(self, fasta_entries, score_model_conservation) -> Iterator[str]:
+        """
+        Versão incremental de scattered_conservation_pattern: gera o token de cada
+        coluna assim que ele é calculado.
+        """
         # Completa as sequências com '-' (gaps)
         self.fasta_entries_with_dashes, self.max_length = self.fasta_service.complete_sequences_with_dash(fasta_entries)
+        weights = self.column_weights(self.fasta_entries_with_dashes)
 
-        for i in range(self.max_length):
-            # Extrai os caracteres de todas as sequências na posição i
-            characters_at_position_i = [entry.sequence[i] for entry in self.fasta_entries_with_dashes]
-            
-            # Encontra o caractere mais frequente na posição atual
-            currently_char = self.list_processing_service.find_most_frequent_element(characters_at_position_i)
-
-            # Verifica se todos os caracteres na posição são iguais (conservação completa)
-            full_conservation = all(aminoacid == characters_at_position_i[0] for aminoacid in characters_at_position_i)
-
-            # Verifica a conservação com base no modelo de pontuação fornecido
-            if score_model_conservation == 'BLOSUM62':
-                conservation = all(
-                    Aminoacid.get_aminoacid(amino).equals_substitution_matrix_blossum62_1(
-                        Aminoacid.get_aminoacid(currently_char)
-                    ) for amino in characters_at_position_i
-                )
+        # Percorre as colunas (os caracteres de todas as sequências na posição i)
+        for characters_at_position_i in zip(*(entry.sequence for entry in self.fasta_entries_with_dashes)):
+            yield self.conservation_token(characters_at_position_i, score_model_conservation, weights)
+
+    def trimmed_conservation_pattern(
+        self,
+        fasta_entries,
+        score_model_conservation,
+        max_gap_fraction: float,
+        trim_mode: str = 'collapse'
+    ) -> list[str]:
+        """
+        Gera o padrão de conservação dispersa sem calcular as colunas com fração de
+        gaps acima de max_gap_fraction, percorrendo o alinhamento uma única vez
+        coluna a coluna.
+
+        Com trim_mode 'collapse', cada sequência de colunas removidas com o mesmo
+        token (o que o cálculo completo daria a cada uma delas) vira um único token,
+        e as assinaturas ficam iguais às do alinhamento sem remoção; com 'drop', as
+        colunas são descartadas. self.column_map guarda, para cada token gerado, o
+        intervalo (início, fim) de colunas do alinhamento original que ele representa.
+
+        Retorna:
+        - Uma lista de strings representando o padrão de conservação dispersa reduzido.
+        """
+        self.fasta_entries_with_dashes, self.max_length = self.fasta_service.complete_sequences_with_dash(fasta_entries)
+        weights = [entry.weight for entry in self.fasta_entries_with_dashes]
+        total_weight = sum(weights)
+        weighted = any(weight != 1 for weight in weights)
+        token_weights = weights if weighted else None
+
+        scattered_conservation_pattern = []
+        self.column_map = []
+        trimmed_start = None  # Início da sequência atual de colunas removidas
+        trimmed_token = None  # Token das colunas da sequência atual
+        kept_columns = 0
+
+        def close_trimmed_columns(end):
+            if trimmed_start is not None and trim_mode == 'collapse':
+                scattered_conservation_pattern.append(trimmed_token)
+                self.column_map.append((trimmed_start, end))
+
+        for i, column in enumerate(zip(*(entry.sequence for entry in self.fasta_entries_with_dashes))):
+            if weighted:
+                gaps = sum(weight for character, weight in zip(column, weights) if character in '-.')
             else:
-                conservation = all(
-                    Aminoacid.get_aminoacid(amino).equals_classification(
-                        Aminoacid.get_aminoacid(currently_char)
-                    ) for amino in characters_at_position_i
-                )
+                gaps = column.count('-') + column.count('.')
 
-            if full_conservation:
-                if currently_char in ['-', '.']:
-                    scattered_conservation_pattern.append('-')
-                else:
-                    scattered_conservation_pattern.append(currently_char or '0')
+            if gaps > max_gap_fraction * total_weight:
+                token = None
+                if trim_mode == 'collapse':
+                    token = self.trimmed_column_token(column, gaps == total_weight, score_model_conservation, token_weights)
+                # Uma nova sequência começa quando o token muda
+                if trimmed_start is None or token != trimmed_token:
+                    close_trimmed_columns(i - 1)
+                    trimmed_start, trimmed_token = i, token
+                continue
+
+            close_trimmed_columns(i - 1)
+            trimmed_start = trimmed_token = None
+            scattered_conservation_pattern.append(
+                self.conservation_token(column, score_model_conservation, token_weights)
+            )
+            self.column_map.append((i, i))
+            kept_columns += 1
+
+        close_trimmed_columns(self.max_length - 1)
+
+        self.trimming_report = {
+            'original_columns': self.max_length,
+            'trimmed_columns': self.max_length - kept_columns,
+            'trim_mode': trim_mode,
+        }
+        return scattered_conservation_pattern
+
+    def trimmed_column_token(self, column: tuple[str, ...], only_gaps: bool, score_model_conservation, weights) -> str:
+        """
+        Retorna o token que conservation_token daria a uma coluna removida por
+        trimmed_conservation_pattern, sem comparar os resíduos: um gap nunca é
+        equivalente a um resíduo, então uma coluna com os dois é 'x0' (se tiver '-')
+        ou 'x'. Só as colunas com '-' e '.' misturados passam pelo cálculo completo.
+        """
+        if not only_gaps:
+            return 'x0' if '-' in column else 'x'
+        if all(character == column[0] for character in column):
+            return '-'
+        return self.conservation_token(column, score_model_conservation, weights)
+
+    def restore_trimmed_groups(
+        self,
+        group_repeated_strings: list[tuple[list[str], tuple[int, int]]]
+    ) -> list[tuple[list[str], tuple[int, int]]]:
+        """
+        Converte os grupos calculados sobre o padrão reduzido por
+        trimmed_conservation_pattern para as coordenadas do alinhamento original,
+        usando self.column_map: os intervalos são recalculados, com a mesma regra de
+        group_repeated_strings, a partir da coluna original em que cada grupo começa,
+        e cada grupo passa a ter o tamanho das colunas que representa.
+        """
+        result = []
+        first = 0
+        last_end = None  # Fim do intervalo do último grupo convertido
+
+        for n, (tokens, _) in enumerate(group_repeated_strings):
+            last = first + len(tokens) - 1
+            width = sum(end - start + 1 for start, end in self.column_map[first:last + 1])
+
+            if n == len(group_repeated_strings) - 1:
+                original_range = (0 if last_end is None else last_end, self.max_length - 1)
             else:
-                if conservation:
-                    unique_characters = ''.join(set(characters_at_position_i))
-                    scattered_conservation_pattern.append(f'[{unique_characters}]')
-                else:
-                    if '-' in characters_at_position_i:
-                        scattered_conservation_pattern.append('x0')
-                    else:
-                        scattered_conservation_pattern.append('x')
+                next_start = self.column_map[last + 1][0]
+                original_range = (0 if last_end is None else last_end + 1, next_start)
+                last_end = next_start
+
+            result.append(([tokens[0]] * width, original_range))
+            first = last + 1
+
+        return result
+
+    def stratified_sample(self, fasta_entries: list[FastaEntry], sample_size: int, seed: int) -> list[FastaEntry]:
+        """
+        Sorteia uma amostra estratificada: as entradas são divididas, na ordem do
+        arquivo, em sample_size estratos contíguos e uma entrada é sorteada de cada um.
+        """
+        rng = random.Random(seed)
+        total = len(fasta_entries)
+        sample = []
+
+        for stratum in range(sample_size):
+            first = stratum * total // sample_size
+            last = (stratum + 1) * total // sample_size
+            sample.append(fasta_entries[rng.randrange(first, last)])
+
+        return sample
+
+    def sampled_conservation_pattern(self, fasta_entries, score_model_conservation, sample_size: int, seed: int = 0):
+        """
+        Gera um padrão de conservação dispersa aproximado, estimando a composição de
+        cada coluna a partir de uma amostra estratificada das sequências.
+
+        Uma coluna 'x0' na amostra é definitiva: nem a falta de conservação nem a
+        presença de gap podem ser desfeitas pelas sequências não amostradas. Colunas
+        conservadas na amostra são incertas e recalculadas com todas as sequências.
+        Colunas 'x' ficam em self.estimated_columns, pois só a presença de '-' é
+        desconhecida; refine_estimated_columns as verifica depois.
+
+        Parâmetros:
+        - fasta_entries: Uma lista de objetos FastaEntry.
+        - score_model_conservation: O modelo de conservação a ser usado (ex: 'BLOSUM62').
+        - sample_size: Quantidade de sequências amostradas.
+        - seed: Semente do gerador aleatório, para resultados reprodutíveis.
+
+        Retorna:
+        - Uma lista de strings representando o padrão de conservação dispersa.
+        """
+        if sample_size >= len(fasta_entries):
+            self.estimated_columns = set()
+            return self.scattered_conservation_pattern(fasta_entries, score_model_conservation)
+
+        scattered_conservation_pattern = []
+        self.fasta_entries_with_dashes, self.max_length = self.fasta_service.complete_sequences_with_dash(fasta_entries)
+        weights = self.column_weights(self.fasta_entries_with_dashes)
+        sample = self.stratified_sample(self.fasta_entries_with_dashes, sample_size, seed)
+        sample_weights = self.column_weights(sample)
+
+        self.estimated_columns = set()
+
+        for i, sampled_characters in enumerate(zip(*(entry.sequence for entry in sample))):
+            token = self.conservation_token(sampled_characters, score_model_conservation, sample_weights)
+
+            if token == 'x':
+                self.estimated_columns.add(i)
+            elif token != 'x0':
+                # Coluna incerta: recalcula com todas as sequências
+                characters_at_position_i = [entry.sequence[i] for entry in self.fasta_entries_with_dashes]
+                token = self.conservation_token(characters_at_position_i, score_model_conservation, weights)
+
+            scattered_conservation_pattern.append(token)
 
         return scattered_conservation_pattern
     
+    def boundary_ranges(self, scattered_conservation_pattern: list[str]) -> list[tuple[int, int]]:
+        """
+        Retorna os intervalos das sequências de 'x'/'x0' no início e no fim do padrão.
+        count_group_repeated_strings descarta o primeiro e o último grupo se forem
+        'x', mas não se forem 'x0', então esses grupos mudam onde os motivos começam
+        e terminam.
+        """
+        is_x = lambda token: token in ('x', 'x0')
+        length = len(scattered_conservation_pattern)
+
+        leading = 0
+        while leading < length and is_x(scattered_conservation_pattern[leading]):
+            leading += 1
+        trailing = length
+        while trailing > leading and is_x(scattered_conservation_pattern[trailing - 1]):
+            trailing -= 1
+
+        return [(0, leading - 1), (trailing, length - 1)]
+
+    def refine_estimated_columns(self, scattered_conservation_pattern: list[str], motifs) -> bool:
+        """
+        Verifica, com todas as sequências, as colunas estimadas ('x' na amostra) que
+        estão dentro dos motivos ou nos grupos de 'x' das pontas do padrão (ver
+        boundary_ranges): a coluna vira 'x0' se alguma sequência tiver '-'.
+
+        Retorna:
+        - True se algum token mudou e os motivos precisam ser recalculados.
+        """
+        changed = False
+        ranges = [self.motif_range(motif) for motif in motifs] + self.boundary_ranges(scattered_conservation_pattern)
+
+        for first, last in ranges:
+            for i in sorted(column for column in self.estimated_columns if first <= column <= last):
+                self.estimated_columns.discard(i)
+                if any(entry.sequence[i] == '-' for entry in self.fasta_entries_with_dashes):
+                    scattered_conservation_pattern[i] = 'x0'
+                    changed = True
+
+        return changed
+    
     def x_min_max_on_the_gaps(self, a: int, b: int) -> (int, int):
         """
         Calcula o valor mínimo e máximo de caracteres diferentes de gaps ('-')
@@ -172,10 +680,7 @@ class PROSITEProcessingService:
         min_x = float('inf')  # Inicializa o mínimo com infinito
         max_x = 0
 
-        for fasta_entry in self.fasta_entries_with_dashes:
-            # Extrai o substring da sequência no intervalo [a, b)
-            sub_sequence = fasta_entry.sequence[a:b]
-
+        for sub_sequence in self.sub_sequences(a, b):
             # Calcula o número de caracteres que não são gaps ('-')
             number_of_x = length - sub_sequence.count('-')
 
@@ -193,66 +698,97 @@ class PROSITEProcessingService:
 
         result = (min_x, max_x)
         return result
+
+    def sub_sequences(self, a: int, b: int) -> Iterator[str]:
+        """
+        Gera o substring [a, b) de cada sequência do alinhamento completado,
+        lendo do disco quando o processamento é feito fora da memória.
+        """
+        if self.column_store is not None:
+            yield from self.column_store.row_slices(a, b)
+            return
+
+        for fasta_entry in self.fasta_entries_with_dashes:
+            yield fasta_entry.sequence[a:b]
     
     def group_repeated_strings(self, scattered_conservation_pattern: list[str]) -> list[tuple[list[str], tuple[int, int]]]:
-        result = []
-        result_aux = []
-        range_positions = []
+        return list(self.iter_group_repeated_strings(scattered_conservation_pattern))
+
+    def iter_group_repeated_strings(self, scattered_conservation_pattern: Iterable[str]) -> Iterator[tuple[list[str], tuple[int, int]]]:
+        """
+        Versão incremental de group_repeated_strings: consome os tokens um a um e
+        gera cada grupo assim que ele é fechado.
+        """
+        last_end = None  # Fim do intervalo do último grupo gerado
         temp = []
+        i = -1
 
-        for i in range(len(scattered_conservation_pattern)):
-            current = scattered_conservation_pattern[i]
-            
-            if self.x_gap_compare(temp[-1] if temp else None, current):
+        for i, current in enumerate(scattered_conservation_pattern):
+            if self.x_gap_comparate(temp[-1] if temp else None, current):
                 temp.append('x0')
             elif not temp or temp[-1] == current:
                 temp.append(current)
             else:
-                result_aux.append(temp.copy())
+                start = 0 if last_end is None else last_end + 1
+                yield temp, (start, i)
+                last_end = i
                 temp = [current]
 
-                if len(result_aux) == 1:
-                    range_positions.append((0, i))
-                    result.append((result_aux[0], range_positions[0]))
-                else:
-                    range_positions.append((range_positions[-1][1] + 1, i))
-                    result.append((result_aux[-1], range_positions[-1]))
-
         if temp:
-            result.append((temp.copy(), (range_positions[-1][1], len(scattered_conservation_pattern) - 1)))
-
-        return result
+            yield temp, (0 if last_end is None else last_end, i)
     
     def count_group_repeated_strings(
         self, 
         fasta_entries: list[FastaEntry], 
         group_repeated_strings: list[tuple[list[str], tuple[int, int]]]
     ) -> list[tuple[str, int, tuple[int, int]]]:
-        
-        # result será uma lista que armazena os resultados finais
-        result = []
+        return list(self.iter_count_group_repeated_strings(group_repeated_strings))
+
+    def iter_count_group_repeated_strings(
+        self,
+        group_repeated_strings: Iterable[tuple[list[str], tuple[int, int]]]
+    ) -> Iterator[tuple[str, int, tuple[int, int]]]:
+        """
+        Versão incremental de count_group_repeated_strings. Segura um grupo para
+        poder descartar o último elemento se ele for '-' ou 'x'.
+        """
+        pending = None
+        first = True
 
         for repeats in group_repeated_strings:
-            # Para cada grupo de strings repetidas, adicionamos uma tupla ao resultado
-            result.append((repeats[0][0], len(repeats[0]), repeats[1]))
+            # Para cada grupo de strings repetidas, geramos uma tupla
+            group = (repeats[0][0], len(repeats[0]), repeats[1])
 
-        # Se o primeiro elemento for '-' ou 'x', remove-o
-        if result and (result[0][0] == '-' or result[0][0] == 'x'):
-            result.pop(0)
+            # Se o primeiro elemento for '-' ou 'x', descarta-o
+            if first:
+                first = False
+                if group[0] == '-' or group[0] == 'x':
+                    continue
 
-        # Se o último elemento for '-' ou 'x', remove-o
-        if result and (result[-1][0] == '-' or result[-1][0] == 'x'):
-            result.pop()
+            if pending is not None:
+                yield pending
+            pending = group
 
-        return result
+        # Se o último elemento for '-' ou 'x', descarta-o
+        if pending is not None and pending[0] != '-' and pending[0] != 'x':
+            yield pending
     
     def x_threshold_divider(
         self, 
         count_group_repeated_strings: list[tuple[str, int, tuple[int, int]]], 
         xthreshold: int = 20
     ) -> list[list[tuple[str, int, tuple[int, int]]]]:
-        
-        result = []  # Lista para armazenar os resultados
+        return list(self.iter_x_threshold_divider(count_group_repeated_strings, xthreshold))
+
+    def iter_x_threshold_divider(
+        self,
+        count_group_repeated_strings: Iterable[tuple[str, int, tuple[int, int]]],
+        xthreshold: int = 20
+    ) -> Iterator[list[tuple[str, int, tuple[int, int]]]]:
+        """
+        Versão incremental de x_threshold_divider: gera cada motivo assim que uma
+        sequência de 'x' maior ou igual ao X-Threshold o fecha.
+        """
         aux = []  # Lista auxiliar para agrupar strings
 
         for group in count_group_repeated_strings:
@@ -260,13 +796,11 @@ class PROSITEProcessingService:
             if ((group[0] == 'x' or group[0] == 'x0') and group[1] < xthreshold) or (group[0] != 'x' and group[0] != 'x0'):
                 aux.append(group)
             elif aux:  # Se a lista auxiliar não estiver vazia
-                result.append(aux)
+                yield aux
                 aux = []  # Limpa a lista auxiliar
 
-        if aux:  # Se ainda houver elementos na lista auxiliar, adicione ao resultado
-            result.append(aux)
-
-        return result
+        if aux:  # Se ainda houver elementos na lista auxiliar, gera o último motivo
+            yield aux
     
     def fitx_threshold_divider(
         self, 
@@ -283,7 +817,6 @@ class PROSITEProcessingService:
             if motif:
                 result.append(motif)
 
-        print(result)  # Usar print para depuração (equivalente ao console.log em JS)
         return result
     
     def format_prosite_motifs_pattern(
@@ -310,30 +843,223 @@ class PROSITEProcessingService:
 
         return result  # Retorna a lista de resultados
     
+    def motif_range(self, motif: list[tuple[str, int, tuple[int, int]]]) -> tuple[int, int]:
+        """
+        Retorna o intervalo de colunas do alinhamento coberto por um motivo.
+        """
+        return motif[0][2][0], motif[-1][2][1]
+
+    def pattern_motifs(
+        self,
+        fasta_entries: list[FastaEntry],
+        scattered_conservation_pattern: list[str],
+        xthreshold: int | None
+    ) -> list[list[tuple[str, int, tuple[int, int]]]]:
+        """
+        Agrupa o padrão de conservação dispersa e o divide em motivos pelo X-Threshold.
+        """
+        group_repeated_strings = self.group_repeated_strings(scattered_conservation_pattern)
+        if self.column_map is not None:
+            # Volta para as coordenadas do alinhamento original
+            group_repeated_strings = self.restore_trimmed_groups(group_repeated_strings)
+
+        return self.fitx_threshold_divider(
+            self.x_threshold_divider(
+                self.count_group_repeated_strings(fasta_entries, group_repeated_strings),
+                xthreshold
+            )
+        )
+
+    def prepare_fasta_entries(
+        self,
+        fasta_content: str,
+        deduplicate: bool = False,
+        identity_threshold: float | None = None
+    ) -> tuple[list[FastaEntry], int]:
+        """
+        Converte o conteúdo FASTA em objetos FastaEntry, removendo a redundância se solicitado.
+
+        Retorna:
+        - Uma tupla com as entradas e a quantidade de registros lidos, antes do filtro.
+        """
+        # Parse the FASTA content into entries
+        records = self.parse_fasta(fasta_content)
+        fasta_entries = [FastaEntry(entry['name'], entry['sequence']) for entry in records]
+
+        # Reduce redundancy, keeping one weighted representative per group
+        if deduplicate or identity_threshold is not None:
+            fasta_entries = self.redundancy_filter_service.filter(fasta_entries, identity_threshold)
+
+        return fasta_entries, len(records)
+
     def process_fasta(
         self, 
         fasta_content: str, 
         score_model_conservation: str, 
-        xthreshold: int | None
+        xthreshold: int | None,
+        deduplicate: bool = False,
+        identity_threshold: float | None = None,
+        sample_size: int | None = None,
+        seed: int = 0,
+        max_gap_fraction: float | None = None,
+        trim_mode: str = 'collapse'
     ) -> list[list[str]]:
-        
-        # Parse the FASTA content into entries
-        fasta_entries = self.parse_fasta(fasta_content)
-
-        # Process the parsed entries through the defined methods
-        return self.format_prosite_motifs_pattern(
-            self.fit_x_treshold_divider(
-                self.x_treshold_divider(
-                    self.count_group_repeated_strings(
-                        fasta_entries,
-                        self.group_repeated_strings(
-                            self.scattered_conservation_pattern(
-                                fasta_entries,
-                                score_model_conservation
-                            )
-                        )
+        """
+        Gera as assinaturas PROSITE a partir do conteúdo FASTA.
+
+        Parâmetros:
+        - deduplicate: Se True, colapsa as sequências duplicadas antes do cálculo da conservação.
+        - identity_threshold: Se informado, agrupa também as sequências com identidade acima do limiar.
+        - sample_size: Se informado, ativa o modo aproximado, estimando as colunas a partir de
+          uma amostra estratificada com esse tamanho. O resultado fica em self.sampling_report.
+        - seed: Semente da amostragem do modo aproximado.
+        - max_gap_fraction: Se informado, remove ('drop') ou colapsa ('collapse', conforme
+          trim_mode) as colunas com fração de gaps acima desse valor antes do cálculo da
+          conservação. As posições dos motivos continuam referentes ao alinhamento original
+          e o resumo fica em self.trimming_report. Não pode ser combinado com sample_size.
+        """
+        if sample_size is not None and sample_size < 1:
+            raise ValueError('sample_size deve ser maior que zero.')
+        if max_gap_fraction is not None and sample_size is not None:
+            raise ValueError('max_gap_fraction não pode ser combinado com sample_size.')
+        if max_gap_fraction is not None and not 0 <= max_gap_fraction <= 1:
+            raise ValueError('max_gap_fraction deve estar entre 0 e 1.')
+        if trim_mode not in ('collapse', 'drop'):
+            raise ValueError(f'trim_mode inválido: {trim_mode!r}')
+
+        fasta_entries, _ = self.prepare_fasta_entries(fasta_content, deduplicate, identity_threshold)
+
+        # Compute the conservation pattern, exactly, on the trimmed alignment or from a sample
+        self.sampling_report = None
+        self.trimming_report = None
+        self.column_map = None
+        if max_gap_fraction is not None:
+            scattered_conservation_pattern = self.trimmed_conservation_pattern(
+                fasta_entries,
+                score_model_conservation,
+                max_gap_fraction,
+                trim_mode
+            )
+        elif sample_size is None:
+            scattered_conservation_pattern = self.scattered_conservation_pattern(fasta_entries, score_model_conservation)
+        else:
+            scattered_conservation_pattern = self.sampled_conservation_pattern(
+                fasta_entries,
+                score_model_conservation,
+                sample_size,
+                seed
+            )
+
+        motifs = self.pattern_motifs(fasta_entries, scattered_conservation_pattern, xthreshold)
+
+        if sample_size is not None:
+            # Verify the estimated columns inside the motifs until no token changes
+            while self.refine_estimated_columns(scattered_conservation_pattern, motifs):
+                motifs = self.pattern_motifs(fasta_entries, scattered_conservation_pattern, xthreshold)
+
+            # A motif is confirmed when none of its columns was left estimated
+            confirmed_motifs = []
+            for motif in motifs:
+                first, last = self.motif_range(motif)
+                confirmed_motifs.append(not any(first <= i <= last for i in self.estimated_columns))
+
+            self.sampling_report = {
+                'sample_size': sample_size,
+                'seed': seed,
+                'estimated_columns': sorted(self.estimated_columns),
+                # Upper bound (95%) of the fraction of sequences with a gap missed by the sample (rule of three)
+                'gap_fraction_bound': min(1.0, 3 / sample_size) if self.estimated_columns else 0.0,
+                'confirmed_motifs': confirmed_motifs,
+            }
+
+        return self.format_prosite_motifs_pattern(motifs)
+
+    def process_fasta_with_progress(
+        self,
+        fasta_content: str,
+        score_model_conservation: str,
+        xthreshold: int | None,
+        progress: Callable[[str, dict], None],
+        deduplicate: bool = False,
+        identity_threshold: float | None = None,
+        progress_steps: int = 100
+    ) -> list[list[str]]:
+        """
+        Gera as assinaturas PROSITE como process_fasta, informando o andamento do
+        processamento pela função progress(evento, dados):
+
+        - 'parsed': quantidade de registros lidos e de sequências processadas;
+        - 'columns': colunas processadas do total, em até progress_steps avisos;
+        - 'motif': cada motivo formatado, assim que x_threshold_divider o fecha.
+        """
+        fasta_entries, records = self.prepare_fasta_entries(fasta_content, deduplicate, identity_threshold)
+        progress('parsed', {'records': records, 'sequences': len(fasta_entries)})
+
+        def scattered_conservation_pattern():
+            interval = None
+            for i, token in enumerate(self.iter_scattered_conservation_pattern(fasta_entries, score_model_conservation), 1):
+                yield token
+                interval = interval or max(1, self.max_length // progress_steps)
+                if i % interval == 0 or i == self.max_length:
+                    progress('columns', {'processed': i, 'total': self.max_length})
+
+        motifs = self.iter_x_threshold_divider(
+            self.iter_count_group_repeated_strings(
+                self.iter_group_repeated_strings(scattered_conservation_pattern())
+            ),
+            xthreshold
+        )
+
+        result = []
+        for motif in motifs:
+            for formatted_motif in self.format_prosite_motifs_pattern(self.fitx_threshold_divider([motif])):
+                progress('motif', {'index': len(result), 'motif': formatted_motif})
+                result.append(formatted_motif)
+
+        return result
+
+    def process_fasta_out_of_core(
+        self,
+        fasta_lines: Iterable[bytes | str],
+        score_model_conservation: str,
+        xthreshold: int | None,
+        memory_budget: int
+    ) -> list[list[str]]:
+        """
+        Gera as assinaturas PROSITE sem carregar o alinhamento na memória.
+
+        As sequências são gravadas em um arquivo temporário column-major e processadas
+        coluna a coluna, em blocos limitados por memory_budget bytes; os grupos e
+        motivos são produzidos de forma incremental.
+
+        Parâmetros:
+        - fasta_lines: As linhas do arquivo FASTA (por exemplo, o arquivo enviado).
+        - memory_budget: Quantidade máxima de bytes do alinhamento mantida em memória.
+        """
+        result = []
+
+        with ColumnMajorAlignment(memory_budget) as column_store:
+            column_store.load(fasta_lines)
+            self.column_store = column_store
+            self.max_length = column_store.max_length
+
+            try:
+                # The token only depends on the column composition, so each column is read once, in chunks
+                scattered_conservation_pattern = (
+                    self.conservation_token(list(composition), score_model_conservation, list(composition.values()))
+                    for composition in column_store.compositions()
+                )
+
+                motifs = self.iter_x_threshold_divider(
+                    self.iter_count_group_repeated_strings(
+                        self.iter_group_repeated_strings(scattered_conservation_pattern)
                     ),
                     xthreshold
                 )
-            )
-        )
\ No newline at end of file
+
+                for motif in motifs:
+                    result.extend(self.format_prosite_motifs_pattern(self.fitx_threshold_divider([motif])))
+            finally:
+                self.column_store = None
+
+        return result
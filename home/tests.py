@@ -1,3 +1,534 @@
-from django.test import TestCase
+import io
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.conf import settings
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from .admission import AdmissionController
+from .aminoacid import Aminoacid, Classification
+from .proteome_index import ALPHABET, PrositePattern, ProteomeIndex
+from .services import CompositionTokenCache, FastaEntry, FastaService, ListProcessingService, PROSITEProcessingService, RedundancyFilterService
+from .views import admission_controller
+
+AMINOACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+
+
+def random_family(rng: random.Random, sequences: int, length: int, mutation_rate: float = 0.2, gap_rate: float = 0.05) -> str:
+    """
+    Gera o conteúdo FASTA de uma família de sequências alinhadas, derivadas de uma
+    sequência ancestral com substituições, gaps ('-') e algumas duplicatas.
+    """
+    ancestor = [rng.choice(AMINOACIDS) for _ in range(length)]
+    family = []
+
+    for n in range(sequences):
+        if family and rng.random() < 0.2:
+            family.append(rng.choice(family))
+            continue
+
+        sequence = []
+        for residue in ancestor:
+            roll = rng.random()
+            if roll < gap_rate:
+                sequence.append('-')
+            elif roll < gap_rate + mutation_rate:
+                sequence.append(rng.choice(AMINOACIDS))
+            else:
+                sequence.append(residue)
+        # Algumas sequências terminam antes e são completadas com '.'
+        family.append(''.join(sequence[:length - rng.randrange(3)]))
+
+    return ''.join(f'>s{n}\n{sequence}\n' for n, sequence in enumerate(family))
+
+
+def normalize(signatures: list[list[str]]) -> list[list[str]]:
+    """
+    Ordena os caracteres dos tokens '[...]', cuja ordem não é definida.
+    """
+    sort_set = lambda match: '[' + ''.join(sorted(match.group(1))) + ']'
+    return [[re.sub(r'\[([^\]]*)\]', sort_set, token) for token in motif] for motif in signatures]
+
+
+class ServiceTestCase(SimpleTestCase):
+    def make_service(self, **kwargs) -> PROSITEProcessingService:
+        return PROSITEProcessingService(FastaService(), ListProcessingService(), **kwargs)
+
+    def signatures(self, method, *args, **kwargs) -> list[list[str]]:
+        return normalize(method(*args, **kwargs))
+
+
+class ConservationTokenTests(ServiceTestCase):
+    def token(self, column: str) -> str:
+        return normalize([[self.make_service().conservation_token(list(column), '1')]])[0][0]
+
+    def test_get_aminoacid_finds_residues(self):
+        self.assertEqual(Aminoacid.get_aminoacid('A').classification, Classification.HYDROFOBIC)
+        self.assertEqual(Aminoacid.get_aminoacid('s').classification, Classification.POLAR_UNCHARGED)
+        self.assertEqual(Aminoacid.get_aminoacid('-').classification, Classification.NONE)
+        self.assertEqual(Aminoacid.get_aminoacid('X').classification, Classification.UNKNOWN)
+
+    def test_classification_tokens(self):
+        self.assertEqual(self.token('AS'), 'x')
+        self.assertEqual(self.token('ST'), '[ST]')
+        self.assertEqual(self.token('AA'), 'A')
+        self.assertEqual(self.token('--'), '-')
+        self.assertEqual(self.token('A-'), 'x0')
+
+    def test_unknown_letters_are_not_conserved_with_gaps(self):
+        self.assertEqual(self.token('X-'), 'x0')
+        self.assertEqual(self.token('X.'), 'x')
+        self.assertEqual(self.token('XB'), 'x')
+        self.assertEqual(self.token('XX'), 'X')
+
+
+class WarmUpTests(SimpleTestCase):
+    STARTUP_SCRIPT = (
+        'import django; django.setup()\n'
+        'from home.aminoacid import Aminoacid\n'
+        'print(len(Aminoacid.BY_L1))\n'
+    )
+
+    def lookup_tables_after_setup(self, warmup: str) -> int:
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE, 'PSPGD_WARMUP': warmup}
+        process = subprocess.run(
+            [sys.executable, '-c', self.STARTUP_SCRIPT],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True
+        )
+        return int(process.stdout.split()[-1])
+
+    def test_tables_are_built_before_the_first_lookup(self):
+        self.assertGreater(self.lookup_tables_after_setup('1'), 0)
+        self.assertEqual(self.lookup_tables_after_setup('0'), 0)
+
+    def test_ready_respects_the_warmup_setting(self):
+        config = apps.get_app_config('home')
+        with mock.patch('home.warmup.warm_up') as warm_up:
+            with override_settings(PSPGD_WARMUP=False):
+                config.ready()
+            warm_up.assert_not_called()
+
+            with override_settings(PSPGD_WARMUP=True):
+                config.ready()
+            warm_up.assert_called_once_with()
+
+
+class RedundancyFilterServiceTests(SimpleTestCase):
+    def setUp(self):
+        self.service = RedundancyFilterService()
+
+    def screen(self, a: str, b: str, identity_threshold: float) -> bool:
+        return self.service.kmer_screen(
+            self.service.kmers(a),
+            self.service.residue_mask(a),
+            self.service.kmers(b),
+            self.service.residue_mask(b),
+            identity_threshold
+        )
+
+    def test_screen_accepts_pairs_exactly_at_threshold(self):
+        for a, b, identity_threshold in (('LADAC', 'LADGC', 0.8), ('KMDEEELMED', 'KTDEEELMED', 0.9)):
+            self.assertEqual(self.service.identity(a, b), identity_threshold)
+            self.assertTrue(self.screen(a, b, identity_threshold))
+
+    def test_screen_never_rejects_pairs_accepted_by_identity(self):
+        rng = random.Random(0)
+        accepted = 0
+
+        for _ in range(5000):
+            length = rng.randrange(1, 30)
+            # Alfabeto pequeno para gerar k-mers repetidos
+            a = ''.join(rng.choice('AC-') for _ in range(length))
+            b = ''.join(c if rng.random() < 0.8 else rng.choice('AC-.') for c in a)
+            b = b[:length - rng.randrange(3)]
+            identity_threshold = rng.choice((0.5, 0.6, 0.7, 0.8, 0.9, 1.0))
+
+            if self.service.identity(a, b) >= identity_threshold:
+                accepted += 1
+                self.assertTrue(self.screen(a, b, identity_threshold), (a, b, identity_threshold))
+
+        self.assertGreater(accepted, 0)
+
+    def test_identity_threshold_out_of_range_raises(self):
+        entries = [FastaEntry('a', 'LADAC'), FastaEntry('b', 'WWWWW')]
+        for identity_threshold in (0, -0.5, 1.5):
+            with self.assertRaises(ValueError):
+                self.service.filter(entries, identity_threshold)
+        self.assertEqual(len(self.service.filter(entries, 1)), 2)
+
+    def test_cluster_by_identity_sums_weights(self):
+        entries = [FastaEntry('a', 'LADAC'), FastaEntry('b', 'LADGC'), FastaEntry('c', 'WWWWW', 2)]
+        representatives = self.service.cluster_by_identity(entries, 0.8)
+
+        self.assertEqual([(entry.name, entry.weight) for entry in representatives], [('a', 2), ('c', 2)])
+
+
+class DeduplicationTests(ServiceTestCase):
+    def test_deduplicate_gives_same_signatures(self):
+        rng = random.Random(1)
+        for _ in range(10):
+            content = random_family(rng, rng.randrange(5, 40), rng.randrange(20, 80))
+            service = self.make_service()
+            self.assertEqual(
+                self.signatures(service.process_fasta, content, '1', 3, deduplicate=True),
+                self.signatures(service.process_fasta, content, '1', 3)
+            )
+
+
+class SamplingTests(ServiceTestCase):
+    def test_invalid_sample_size_raises(self):
+        content = random_family(random.Random(2), 10, 30)
+        for sample_size in (0, -1):
+            with self.assertRaises(ValueError):
+                self.make_service().process_fasta(content, '1', 3, sample_size=sample_size)
+
+    def test_motifs_are_refined_and_confirmed(self):
+        rng = random.Random(3)
+        for _ in range(5):
+            content = random_family(rng, 300, 80, mutation_rate=0.004, gap_rate=0.001)
+            service = self.make_service()
+            exact = self.signatures(service.process_fasta, content, '1', 3)
+            sampled = self.signatures(service.process_fasta, content, '1', 3, sample_size=30)
+
+            self.assertEqual(sampled, exact)
+            self.assertTrue(all(service.sampling_report['confirmed_motifs']))
+            self.assertIsInstance(service.sampling_report['gap_fraction_bound'], float)
+
+    def test_estimated_boundary_columns_are_refined(self):
+        # Só a sequência 7 tem gap na primeira coluna, que fica 'x' na amostra
+        sequences = ['AC' if n % 2 else 'KC' for n in range(20)]
+        sequences[7] = '-C'
+        content = ''.join(f'>s{n}\n{sequence}GGGGG\n' for n, sequence in enumerate(sequences))
+
+        for seed in range(4):
+            service = self.make_service()
+            exact = self.signatures(service.process_fasta, content, '1', 3)
+            sampled = self.signatures(service.process_fasta, content, '1', 3, sample_size=4, seed=seed)
+
+            self.assertEqual(exact, [['x0', 'C', 'G(5)']])
+            self.assertEqual(sampled, exact)
+            self.assertEqual(service.sampling_report['confirmed_motifs'], [True])
+            self.assertEqual(service.sampling_report['estimated_columns'], [])
+
+
+class OutOfCoreTests(ServiceTestCase):
+    def test_out_of_core_gives_same_signatures(self):
+        rng = random.Random(4)
+        for _ in range(5):
+            content = random_family(rng, rng.randrange(5, 40), rng.randrange(20, 80), mutation_rate=0.05)
+            service = self.make_service()
+            expected = self.signatures(service.process_fasta, content, '1', 3)
+
+            for memory_budget in (7, 1000, 10 ** 7):
+                fasta_lines = io.BytesIO(content.encode('utf-8'))
+                self.assertEqual(
+                    self.signatures(service.process_fasta_out_of_core, fasta_lines, '1', 3, memory_budget),
+                    expected
+                )
+
+
+class TrimmingTests(ServiceTestCase):
+    def test_collapse_gives_same_signatures(self):
+        rng = random.Random(9)
+        for _ in range(100):
+            content = random_family(
+                rng, rng.randrange(3, 30), rng.randrange(10, 60),
+                mutation_rate=rng.choice((0.02, 0.1)), gap_rate=rng.choice((0.1, 0.3, 0.5))
+            )
+            max_gap_fraction = rng.choice((0.0, 0.2, 0.5, 0.9))
+            service = self.make_service()
+            self.assertEqual(
+                self.signatures(service.process_fasta, content, '1', 3, max_gap_fraction=max_gap_fraction),
+                self.signatures(service.process_fasta, content, '1', 3),
+                (content, max_gap_fraction)
+            )
+
+    def test_collapse_keeps_gap_runs_apart(self):
+        # Uma coluna 'x0' seguida de uma só de '-', e colunas só de gaps com '-' e '.' misturados
+        content = '>a\nCA-AC-\n>b\nC--AC.\n>c\nC--AC\n'
+        service = self.make_service()
+        self.assertEqual(
+            self.signatures(service.process_fasta, content, '1', 20, max_gap_fraction=0.5),
+            self.signatures(service.process_fasta, content, '1', 20)
+        )
+
+    def test_invalid_max_gap_fraction_raises(self):
+        with self.assertRaises(ValueError):
+            self.make_service().process_fasta('>a\nAC\n', '1', 3, max_gap_fraction=-0.1)
+
+
+class TokenCacheTests(ServiceTestCase):
+    def test_cached_signatures_are_the_same(self):
+        rng = random.Random(10)
+        token_cache = CompositionTokenCache(maxsize=64)
+        for _ in range(10):
+            content = random_family(rng, rng.randrange(5, 40), rng.randrange(20, 80), mutation_rate=0.05)
+            expected = self.signatures(self.make_service().process_fasta, content, '1', 3)
+            cached = self.make_service(token_cache=token_cache)
+
+            self.assertEqual(self.signatures(cached.process_fasta, content, '1', 3), expected)
+            self.assertEqual(self.signatures(cached.process_fasta, content, '1', 3, deduplicate=True), expected)
+
+        stats = token_cache.stats()
+        self.assertGreater(stats['hits'], 0)
+        self.assertLessEqual(stats['size'], 64)
+
+    def test_cached_path_is_not_slower(self):
+        content = random_family(random.Random(11), 1000, 200, mutation_rate=0.05)
+        token_cache = CompositionTokenCache(maxsize=4096)
+        cached = self.make_service(token_cache=token_cache)
+        uncached = self.make_service()
+        cached.process_fasta(content, '1', 3)
+
+        def elapsed(service):
+            start = time.perf_counter()
+            service.process_fasta(content, '1', 3)
+            return time.perf_counter() - start
+
+        self.assertLess(min(elapsed(cached) for _ in range(3)), min(elapsed(uncached) for _ in range(3)))
+        self.assertEqual(token_cache.stats()['misses'], token_cache.stats()['size'])
+
+    def test_lru_eviction_and_stats(self):
+        token_cache = CompositionTokenCache(maxsize=2)
+        token_cache.put('a', 'A')
+        token_cache.put('b', 'B')
+        self.assertEqual(token_cache.get('a'), 'A')
+        token_cache.put('c', 'C')  # 'b' é o menos usado
+
+        self.assertIsNone(token_cache.get('b'))
+        self.assertEqual(token_cache.stats(), {
+            'size': 2, 'maxsize': 2, 'hits': 1, 'misses': 1, 'evictions': 1, 'hit_rate': 0.5,
+        })
+
+
+class ProgressTests(ServiceTestCase):
+    def test_progress_reports_records_and_same_signatures(self):
+        content = random_family(random.Random(6), 30, 60, mutation_rate=0.05)
+        events = []
+        service = self.make_service()
+
+        signatures = self.signatures(
+            service.process_fasta_with_progress, content, '1', 3, lambda event, data: events.append((event, data)),
+            deduplicate=True
+        )
+
+        self.assertEqual(signatures, self.signatures(service.process_fasta, content, '1', 3))
+        parsed = events[0][1]
+        self.assertEqual(parsed['records'], 30)
+        self.assertLessEqual(parsed['sequences'], parsed['records'])
+        self.assertEqual(normalize([data['motif'] for event, data in events if event == 'motif']), signatures)
+
+
+class ProteomeIndexTests(SimpleTestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        # Alfabeto reduzido para que os padrões tenham ocorrências
+        self.sequences = [''.join(rng.choice('ACGHKST') for _ in range(rng.randrange(0, 60))) for _ in range(40)]
+        self.sequences[3] = 'ACXGH'  # Resíduo fora do alfabeto interrompe os k-mers
+
+        self.directory = tempfile.TemporaryDirectory()
+        fasta_path = os.path.join(self.directory.name, 'proteome.fasta')
+        with open(fasta_path, 'w') as fasta_file:
+            fasta_file.write(''.join(f'>p{n}\n{sequence}\n' for n, sequence in enumerate(self.sequences)))
+        self.index = ProteomeIndex.build(fasta_path, os.path.join(self.directory.name, 'index'), kmer_size=3)
+
+    def tearDown(self):
+        self.index.close()
+        self.directory.cleanup()
+
+    def test_csr_lists_every_kmer_position(self):
+        residues = bytes(self.index.residues)
+        expected = {}
+        for position in range(len(residues) - 2):
+            kmer = residues[position:position + 3]
+            if all(residue in ALPHABET for residue in kmer):
+                expected.setdefault(kmer.decode(), []).append(position)
+
+        self.assertEqual(self.index.kmer_offsets[-1], sum(len(positions) for positions in expected.values()))
+        for kmer, positions in expected.items():
+            self.assertEqual(list(self.index.kmer_positions_of(kmer)), positions)
+
+    def test_build_blocks_do_not_change_the_index(self):
+        fasta_path = os.path.join(self.directory.name, 'proteome.fasta')
+        with mock.patch('home.proteome_index.BUILD_BLOCK_SIZE', 7):
+            index = ProteomeIndex.build(fasta_path, os.path.join(self.directory.name, 'blocks'), kmer_size=3)
+        with index:
+            self.assertEqual(list(index.kmer_offsets), list(self.index.kmer_offsets))
+            self.assertEqual(list(index.kmer_positions), list(self.index.kmer_positions))
+
+    def test_anchor_offsets(self):
+        self.assertEqual(PrositePattern('C-x(2,4)-G-H-K-[ST]').anchors(3), [(['G', 'H', 'K', 'ST'], 3, 5)])
+        self.assertEqual(PrositePattern(['G', 'H(2)', 'x0', 'K']).anchors(3), [(['G', 'H', 'H'], 0, 0)])
+        self.assertEqual(
+            PrositePattern('F-[WM]-x(0,2)-E-x-R-[QS]-x-H-E').anchors(2),
+            [(['F', 'MW'], 0, 0), (['R', 'QS'], 4, 6), (['H', 'E'], 7, 9)]
+        )
+        self.assertEqual(PrositePattern('W-W-x-C').anchors(3), [])
+
+    def test_index_search_matches_scan(self):
+        rng = random.Random(8)
+        patterns = ['G-H-K', 'C-x(2,4)-G-H-K-[ST]', 'A-x0-S-T-G', 'K-K-x(0,3)-[AC]', 'G-H-A-x-C-C']
+        for _ in range(40):
+            sequence = rng.choice([sequence for sequence in self.sequences if len(sequence) > 10])
+            start = rng.randrange(len(sequence) - 6)
+            fixed = '-'.join(sequence[start:start + rng.randrange(3, 6)])
+            patterns.append(f'{rng.choice("ST")}-x({rng.randrange(3)},{rng.randrange(3, 5)})-{fixed}')
+
+        for pattern in patterns:
+            self.assertEqual(self.index.search(pattern), self.index.search(pattern, use_index=False), pattern)
+        self.assertTrue(any(self.index.search(pattern) for pattern in patterns))
+
+    def test_short_anchors_are_intersected(self):
+        fasta_path = os.path.join(self.directory.name, 'proteome.fasta')
+        with ProteomeIndex.build(fasta_path, os.path.join(self.directory.name, 'index2'), kmer_size=2) as index:
+            patterns = ['G-H-x-C', 'A-[ST]-x(0,2)-G-x-H-[CK]-x-S', 'K-x(2)-C-C-x(0,1)-G-H', 'S-x-[AC]-G']
+            for pattern in patterns:
+                hits = index.search(pattern)
+                self.assertEqual(index.search_report['strategy'], 'index', pattern)
+                self.assertEqual(hits, index.search(pattern, use_index=False), pattern)
+            self.assertTrue(any(index.search(pattern) for pattern in patterns))
+
+    def test_fallback_to_scan_is_reported(self):
+        self.assertEqual(self.index.search('G-H-x-C'), self.index.search('G-H-x-C', use_index=False))
+        self.assertEqual(self.index.search_report['strategy'], 'scan')
+        self.index.search('C-x(2,4)-G-H-K-[ST]')
+        self.assertEqual(self.index.search_report['strategy'], 'index')
+
+
+class AdmissionTests(SimpleTestCase):
+    def estimate(self, content: str, **fields) -> dict:
+        fasta_file = io.BytesIO(content.encode('utf-8'))
+        fasta_file.name = 'test.fasta'
+        request = RequestFactory().post('/upload_fasta/', {'fasta_file': fasta_file, 'xthreshold': '3', **fields})
+        handler = AdmissionController().install_upload_handler(request, 'fasta_file')
+        request.FILES
+        return handler.estimate
+
+    def test_small_file_is_counted_directly(self):
+        estimate = self.estimate('>a\nAST\n>b\nASS\n>c\nAAS\n', score_model_conservation='1')
+        self.assertEqual((estimate['sequences'], estimate['alignment_length']), (3, 3))
+
+    def test_large_file_is_extrapolated_from_file_length(self):
+        content = ''.join(f'>s{n}\n{"A" * 100}\n' for n in range(2000))
+        estimate = self.estimate(content)
+        self.assertAlmostEqual(estimate['sequences'], 2000, delta=20)
+        self.assertEqual(estimate['alignment_length'], 100)
+
+
+    def test_state_is_shared_between_controllers(self):
+        with tempfile.TemporaryDirectory() as state_dir:
+            # Dois controladores com o mesmo STATE_DIR, como dois workers do servidor
+            limits = {'STATE_DIR': state_dir, 'MAX_CONCURRENT_PER_CLIENT': 1}
+            first, second = AdmissionController(limits), AdmissionController(limits)
+
+            slot = first.clients.acquire('client')
+            self.assertIsNotNone(slot)
+            self.assertIsNone(second.clients.acquire('client'))
+            first.clients.release(slot)
+            second.clients.release(second.clients.acquire('client'))
+
+            job_id = first.jobs.store.create()
+            self.assertEqual(second.jobs.get(job_id), {'status': 'queued'})
+            self.assertIsNone(second.jobs.get('../' + job_id))
+
+    def test_slot_of_dead_process_is_reclaimed(self):
+        with tempfile.TemporaryDirectory() as state_dir:
+            controller = AdmissionController({'STATE_DIR': state_dir, 'MAX_CONCURRENT_PER_CLIENT': 1})
+            slot = controller.clients.acquire('client')
+            process = subprocess.Popen([sys.executable, '-c', 'pass'])
+            process.wait()
+            with open(slot, 'w') as slot_file:
+                slot_file.write(str(process.pid))
+
+            self.assertEqual(controller.clients.acquire('client'), slot)
+
+
+class UploadViewTests(SimpleTestCase):
+    def upload(self, url: str = '/upload_fasta/', content: str = '>a\nAST\n>b\nASS\n', **options):
+        fasta_file = io.BytesIO(content.encode('utf-8'))
+        fasta_file.name = 'test.fasta'
+        data = {'fasta_file': fasta_file, 'score_model_conservation': '1', 'xthreshold': '3', **options}
+        return self.client.post(url, data)
+
+    def test_invalid_sample_size_is_bad_request(self):
+        self.assertEqual(self.upload(sample_size='0').status_code, 400)
+
+    def test_invalid_identity_threshold_is_bad_request(self):
+        self.assertEqual(self.upload(identity_threshold='-1').status_code, 400)
+        self.assertEqual(self.upload(identity_threshold='1.5').status_code, 400)
+        self.assertEqual(self.upload('/upload_fasta/events/', identity_threshold='-1').status_code, 400)
+
+    def test_invalid_memory_budget_is_bad_request(self):
+        self.assertEqual(self.upload(memory_budget='0').status_code, 400)
+        self.assertEqual(self.upload(memory_budget='1000', deduplicate='1').status_code, 400)
+        self.assertEqual(self.upload(memory_budget='1000', sample_size='10').status_code, 400)
+        self.assertEqual(self.upload(memory_budget='1000').status_code, 200)
+
+    def test_events_reject_unsupported_options(self):
+        for options in ({'sample_size': '10'}, {'memory_budget': '1000'}, {'max_gap_fraction': '0.5'}):
+            self.assertEqual(self.upload('/upload_fasta/events/', **options).status_code, 400)
+
+        response = self.upload('/upload_fasta/events/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('event: done', b''.join(response.streaming_content).decode())
+        self.assertEqual(admission_controller.clients.count('127.0.0.1'), 0)
+
+    def wait_for_job(self, status_url: str) -> dict:
+        for _ in range(200):
+            job = self.client.get(status_url).json()
+            if job['status'] in ('done', 'error'):
+                return job
+            time.sleep(0.05)
+        self.fail(f'O job não terminou: {job}')
+
+    def test_costly_upload_goes_to_the_queue(self):
+        content = random_family(random.Random(12), 20, 40)
+        with mock.patch.dict(admission_controller.limits, {'INLINE_COST': 0}):
+            response = self.upload(content=content)
+
+        self.assertEqual(response.status_code, 202)
+        job = self.wait_for_job(response.json()['status_url'])
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['result']['prosite_signatures'], self.upload(content=content).json()['prosite_signatures'])
+        self.assertEqual(admission_controller.clients.count('127.0.0.1'), 0)
+
+    def test_unknown_job_is_not_found(self):
+        self.assertEqual(self.client.get(f'/upload_fasta/jobs/{"0" * 32}/').status_code, 404)
+
+    def test_upload_above_the_limits_is_rejected(self):
+        with mock.patch.dict(admission_controller.limits, {'MAX_UPLOAD_BYTES': 10}):
+            self.assertEqual(self.upload().status_code, 413)
+            self.assertEqual(self.upload('/upload_fasta/events/').status_code, 413)
+
+        with mock.patch.dict(admission_controller.limits, {'MAX_COST': 1}):
+            response = self.upload()
+            self.assertEqual(response.status_code, 413)
+            self.assertEqual(response.json()['estimate']['cost'], 6)
+            self.assertEqual(self.upload('/upload_fasta/events/').status_code, 413)
+        self.assertEqual(admission_controller.clients.count('127.0.0.1'), 0)
+
+    def test_client_above_the_concurrency_limit_is_rejected(self):
+        slots = [admission_controller.clients.acquire('127.0.0.1') for _ in range(admission_controller.clients.max_concurrent)]
+        try:
+            self.assertEqual(self.upload().status_code, 429)
+            self.assertEqual(self.upload('/upload_fasta/events/').status_code, 429)
+        finally:
+            for slot in slots:
+                admission_controller.clients.release(slot)
+        self.assertEqual(self.upload().status_code, 200)
+
+    def test_costly_events_upload_goes_to_the_queue(self):
+        with mock.patch.dict(admission_controller.limits, {'INLINE_COST': 0}):
+            response = self.upload('/upload_fasta/events/')
+
+        self.assertEqual(response.status_code, 202)
+        job = self.wait_for_job(response.json()['status_url'])
+        self.assertEqual(job['status'], 'done')
+        self.assertIn('prosite_signatures', job['result'])
@@ -1,14 +1,28 @@
+import json
+import os
+import queue
+import tempfile
+
+from django.conf import settings
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from .forms import FastaUploadForm
-from .services import PROSITEProcessingService, ListProcessingService, FastaService # Certifique-se de que o serviço está importado
+from .services import PROSITEProcessingService, ListProcessingService, FastaService, CompositionTokenCache, RedundancyFilterService # Certifique-se de que o serviço está importado
 from .aminoacid_colors import AminoacidColorMap
+from .admission import AdmissionController
 
 # Criar uma instância do seu serviço
 fasta_service = FastaService()
 list_processing_service = ListProcessingService()
-prosite_processing_service = PROSITEProcessingService(fasta_service=fasta_service,list_processing_service=list_processing_service)
+# Cache de tokens por composição de coluna, compartilhado por todas as requisições do worker
+token_cache = CompositionTokenCache(getattr(settings, 'PSPGD_TOKEN_CACHE_SIZE', 4096))
+prosite_processing_service = PROSITEProcessingService(fasta_service=fasta_service,list_processing_service=list_processing_service,token_cache=token_cache)
+admission_controller = AdmissionController.from_settings()
+
+def create_prosite_service() -> PROSITEProcessingService:
+    # O serviço guarda o estado do processamento, então cada requisição ou job usa sua própria instância
+    return PROSITEProcessingService(fasta_service=fasta_service, list_processing_service=list_processing_service, token_cache=token_cache)
 
 def home(request):
     title = "BIOINFORMÁTICA ESTRUTURAL"
@@ -19,31 +33,241 @@ def home(request):
     }
     return render(request, 'home/home.html', context)
 
+def read_upload_options(request) -> dict:
+    # Obter valores do formulário
+    xthreshold = request.POST.get('xthreshold')  # Obtém o valor do X-Threshold
+    identity_threshold = request.POST.get('identity_threshold')  # Limiar de identidade para agrupar sequências
+    sample_size = request.POST.get('sample_size')  # Tamanho da amostra do modo aproximado
+    memory_budget = request.POST.get('memory_budget')  # Bytes do alinhamento mantidos em memória
+    max_gap_fraction = request.POST.get('max_gap_fraction')  # Fração de gaps acima da qual a coluna é removida
+
+    return {
+        'score_model_conservation': request.POST.get('score_model_conservation'),  # Modelo de conservação
+        'xthreshold': int(xthreshold) if xthreshold else None,
+        'deduplicate': request.POST.get('deduplicate') in ('1', 'true', 'on'),  # Colapsa sequências duplicadas
+        'identity_threshold': float(identity_threshold) if identity_threshold else None,
+        'sample_size': int(sample_size) if sample_size else None,
+        'seed': int(request.POST.get('seed') or 0),  # Semente da amostragem
+        'memory_budget': int(memory_budget) if memory_budget else None,
+        'max_gap_fraction': float(max_gap_fraction) if max_gap_fraction else None,
+        'trim_mode': request.POST.get('trim_mode') or 'collapse',  # 'collapse' ou 'drop'
+    }
+
+def validate_upload_options(options: dict):
+    """
+    Rejeita, com ValueError, as opções que não podem ser atendidas, antes de o
+    processamento começar (na requisição ou na fila).
+    """
+    RedundancyFilterService.validate_identity_threshold(options['identity_threshold'])
+
+    if options['memory_budget'] is None:
+        return
+
+    if options['memory_budget'] < 1:
+        raise ValueError('memory_budget deve ser maior que zero.')
+
+    # O processamento fora da memória não carrega as sequências, então não faz filtro nem amostragem
+    unsupported = [
+        name for name in ('deduplicate', 'identity_threshold', 'sample_size', 'max_gap_fraction')
+        if options[name] not in (None, False)
+    ]
+    if unsupported:
+        raise ValueError(f'memory_budget não pode ser combinado com {", ".join(unsupported)}.')
+
+def process_upload(service, uploaded_file, options: dict) -> dict:
+    if options['memory_budget'] is not None:
+        # Processa o arquivo enviado linha a linha, sem carregá-lo na memória
+        prosite_signatures = service.process_fasta_out_of_core(
+            uploaded_file,
+            options['score_model_conservation'],
+            options['xthreshold'],
+            options['memory_budget']
+        )
+        return {'prosite_signatures': prosite_signatures}
+
+    contents = uploaded_file.read().decode('utf-8')
+
+    # Processar o conteúdo FASTA
+    fasta_entries = service.parse_fasta(contents)
+    prosite_signatures = service.process_fasta(
+        contents,
+        options['score_model_conservation'],
+        options['xthreshold'],
+        deduplicate=options['deduplicate'],
+        identity_threshold=options['identity_threshold'],
+        sample_size=options['sample_size'],
+        seed=options['seed'],
+        max_gap_fraction=options['max_gap_fraction'],
+        trim_mode=options['trim_mode']
+    )
+
+    return {
+        'fasta_entries': fasta_entries,
+        'prosite_signatures': prosite_signatures,
+        'sampling_report': service.sampling_report,
+        'trimming_report': service.trimming_report,
+    }
+
+def process_queued_upload(upload_path: str, options: dict) -> dict:
+    # Executado em um processo da fila
+    service = create_prosite_service()
+    try:
+        with open(upload_path, 'rb') as upload_file:
+            return process_upload(service, upload_file, options)
+    finally:
+        os.remove(upload_path)
+
+def queue_upload(uploaded_file, options: dict, slot: str, estimate: dict | None) -> JsonResponse:
+    """
+    Envia o upload para a fila em segundo plano; o job libera a vaga do cliente ao terminar.
+    """
+    # O arquivo enviado é apagado no fim da requisição, então é copiado para o processo da fila
+    descriptor, upload_path = tempfile.mkstemp(dir=admission_controller.uploads_dir, suffix='.fasta')
+    with os.fdopen(descriptor, 'wb') as upload_file:
+        for chunk in uploaded_file.chunks():
+            upload_file.write(chunk)
+
+    job_id = admission_controller.jobs.submit(process_queued_upload, upload_path, options, slot=slot)
+    return JsonResponse({
+        'job_id': job_id,
+        'status_url': f'/upload_fasta/jobs/{job_id}/',
+        'estimate': estimate,
+    }, status=202)
+
 @csrf_exempt
 def upload_fasta(request):
     if request.method == 'POST':
-        uploaded_file = request.FILES['fasta_file']  # Nome do campo do formulário
-        contents = uploaded_file.read().decode('utf-8')
-        
-        # Obter valores do formulário
-        score_model_conservation = request.POST.get('score_model_conservation')  # Obtém o valor do modelo de conservação
-        xthreshold = request.POST.get('xthreshold')  # Obtém o valor do X-Threshold
-        xthreshold = int(xthreshold) if xthreshold else None  # Converte para inteiro, se aplicável
-
-        # Processar o conteúdo FASTA
-        fasta_entries = prosite_processing_service.parseFasta(contents)
-        prosite_signatures = prosite_processing_service.processFasta(
-            contents,
-            score_model_conservation,
-            xthreshold
-        )
+        # Rejeita o upload só pelo cabeçalho, antes de ler o corpo da requisição
+        if admission_controller.oversized(request):
+            return JsonResponse({'error': 'Arquivo maior que o limite permitido.'}, status=413)
+
+        slot = admission_controller.clients.acquire(admission_controller.client_key(request))
+        if slot is None:
+            return JsonResponse({'error': 'Muitas requisições simultâneas.'}, status=429)
+
+        queued = False
+        try:
+            upload_handler = admission_controller.install_upload_handler(request, 'fasta_file')
+            files = request.FILES  # Lê o upload, passando pelo handler de admissão
+            if upload_handler.rejected:
+                return JsonResponse({
+                    'error': 'Custo estimado acima do limite permitido.',
+                    'estimate': upload_handler.estimate,
+                }, status=413)
 
-        return JsonResponse({
-            'fasta_entries': fasta_entries,
-            'prosite_signatures': prosite_signatures,
-        })
+            uploaded_file = files['fasta_file']  # Nome do campo do formulário
+            try:
+                options = read_upload_options(request)
+                validate_upload_options(options)
+                if admission_controller.runs_inline(upload_handler.estimate):
+                    return JsonResponse(process_upload(create_prosite_service(), uploaded_file, options))
+            except ValueError as error:
+                # Opções inválidas, como sample_size=0
+                return JsonResponse({'error': str(error)}, status=400)
+
+            response = queue_upload(uploaded_file, options, slot, upload_handler.estimate)
+            queued = True
+            return response
+        finally:
+            if not queued:
+                admission_controller.clients.release(slot)
     return JsonResponse({'error': 'Método não permitido.'}, status=405)
 
+def upload_fasta_job(request, job_id):
+    job = admission_controller.jobs.get(job_id)
+    if job is None:
+        return JsonResponse({'error': 'Job não encontrado.'}, status=404)
+    return JsonResponse(job)
+
+def token_cache_stats(request):
+    return JsonResponse(token_cache.stats())
+
+@csrf_exempt
+def upload_fasta_events(request):
+    """
+    Versão de upload_fasta que responde com um fluxo Server-Sent Events: os eventos
+    'parsed', 'columns' e 'motif' informam o andamento do processamento e o evento
+    'done' traz as assinaturas completas (ou 'error', em caso de falha).
+
+    Os uploads acima do custo INLINE_COST vão para a fila, como em upload_fasta, e
+    a resposta é o job (202) em vez do fluxo. Os demais são processados por um
+    conjunto limitado de threads (STREAM_WORKERS).
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método não permitido.'}, status=405)
+
+    if admission_controller.oversized(request):
+        return JsonResponse({'error': 'Arquivo maior que o limite permitido.'}, status=413)
+
+    slot = admission_controller.clients.acquire(admission_controller.client_key(request))
+    if slot is None:
+        return JsonResponse({'error': 'Muitas requisições simultâneas.'}, status=429)
+
+    handed_off = False  # Depois de entregue ao job ou à thread, eles liberam o cliente
+    try:
+        upload_handler = admission_controller.install_upload_handler(request, 'fasta_file')
+        files = request.FILES  # Lê o upload, passando pelo handler de admissão
+        if upload_handler.rejected:
+            return JsonResponse({
+                'error': 'Custo estimado acima do limite permitido.',
+                'estimate': upload_handler.estimate,
+            }, status=413)
+
+        uploaded_file = files['fasta_file']
+        options = read_upload_options(request)
+
+        # O fluxo de eventos só acompanha o processamento exato, em memória
+        unsupported = [name for name in ('sample_size', 'memory_budget', 'max_gap_fraction') if options[name] is not None]
+        if unsupported:
+            return JsonResponse({
+                'error': f'Opções não suportadas no fluxo de eventos: {", ".join(unsupported)}.',
+            }, status=400)
+        validate_upload_options(options)
+
+        if not admission_controller.runs_inline(upload_handler.estimate):
+            response = queue_upload(uploaded_file, options, slot, upload_handler.estimate)
+            handed_off = True
+            return response
+
+        contents = uploaded_file.read().decode('utf-8')
+        service = create_prosite_service()
+        events = queue.Queue()
+
+        def process():
+            try:
+                prosite_signatures = service.process_fasta_with_progress(
+                    contents,
+                    options['score_model_conservation'],
+                    options['xthreshold'],
+                    lambda event, data: events.put((event, data)),
+                    deduplicate=options['deduplicate'],
+                    identity_threshold=options['identity_threshold']
+                )
+                events.put(('done', {'prosite_signatures': prosite_signatures}))
+            except Exception as error:
+                events.put(('error', {'error': str(error)}))
+            finally:
+                admission_controller.clients.release(slot)
+                events.put(None)
+
+        admission_controller.run_stream(process)
+        handed_off = True
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    finally:
+        if not handed_off:
+            admission_controller.clients.release(slot)
+
+    def stream():
+        while (item := events.get()) is not None:
+            event, data = item
+            yield f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Evita que proxies como o nginx acumulem os eventos
+    return response
+
 def get_color(aminoacid):
     return AminoacidColorMap.COLOR_MAP_HEX[aminoacid]
 
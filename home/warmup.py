@@ -0,0 +1,46 @@
+import gc
+import time
+
+from django.template.loader import get_template
+from django.urls import get_resolver
+
+from .aminoacid import Aminoacid
+
+
+def warm_up() -> dict[str, float]:
+    """
+    Monta, uma única vez, as estruturas imutáveis usadas pelo processamento:
+    as tabelas de aminoácidos, o URLconf, os serviços instanciados em views.py e
+    o template compilado da página inicial.
+
+    Com um servidor que pré-carrega a aplicação (ex: gunicorn --preload), esse
+    trabalho é feito no processo mestre e os workers herdam as estruturas após o
+    fork. Ao final, gc.freeze() move os objetos para a geração permanente, para
+    que as coletas de lixo dos workers não escrevam nessas páginas de memória e
+    elas continuem compartilhadas (copy-on-write).
+
+    Retorna:
+    - O tempo, em segundos, de cada etapa do warm-up.
+    """
+    timings = {}
+
+    start = time.perf_counter()
+    Aminoacid.build_lookup_tables()
+    timings['lookup_tables'] = time.perf_counter() - start
+
+    # Carrega o URLconf, o que importa home.views e instancia os serviços
+    start = time.perf_counter()
+    get_resolver().url_patterns
+    timings['urlconf'] = time.perf_counter() - start
+
+    # Compila o template, que fica no cache do loader de templates
+    start = time.perf_counter()
+    get_template('home/home.html')
+    timings['templates'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    gc.collect()
+    gc.freeze()
+    timings['gc_freeze'] = time.perf_counter() - start
+
+    return timings
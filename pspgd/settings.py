@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -121,3 +122,28 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Build lookup tables and service singletons once at startup, before the
+# workers are forked (see home/warmup.py)
+
+PSPGD_WARMUP = os.environ.get('PSPGD_WARMUP', '1') != '0'
+
+# Admission control for uploads (see home/admission.py): uploads above
+# MAX_UPLOAD_BYTES or MAX_COST (sequences x alignment length) are rejected,
+# jobs above INLINE_COST go to the background queue (a pool of processes).
+# Job state and per-client slots live in STATE_DIR, shared by all workers
+
+PSPGD_ADMISSION = {
+    'MAX_UPLOAD_BYTES': 200 * 1024 * 1024,
+    'MAX_COST': 2 * 10 ** 9,
+    'INLINE_COST': 5 * 10 ** 6,
+    'MAX_CONCURRENT_PER_CLIENT': 2,
+    'BACKGROUND_WORKERS': 2,
+    'STREAM_WORKERS': 4,
+    'STATE_DIR': os.environ.get('PSPGD_STATE_DIR') or None,
+}
+
+# Maximum number of column compositions kept in the per-worker token cache
+# (see CompositionTokenCache in home/services.py); stats at /token_cache/stats/
+
+PSPGD_TOKEN_CACHE_SIZE = 4096
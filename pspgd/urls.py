@@ -21,4 +21,8 @@ from home import views
 urlpatterns = [
     path('', views.home),
     path('home/', views.home),
+    path('upload_fasta/', views.upload_fasta),
+    path('upload_fasta/events/', views.upload_fasta_events),
+    path('upload_fasta/jobs/<str:job_id>/', views.upload_fasta_job),
+    path('token_cache/stats/', views.token_cache_stats),
 ]